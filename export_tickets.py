@@ -15,26 +15,164 @@ configPath = 'configs.json'
 import json
 import requests
 from requests.auth import HTTPBasicAuth
+from requests.adapters import HTTPAdapter
 import csv
 import datetime
 import urllib.request
+import urllib.parse
+import sqlite3
 import math
+import itertools
+import random
+import threading
+import time
+import email.utils
 import io
 import json
+import os
+import numpy as np
+import pandas as pd
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 ########################################################################################################
 #####  function to get list of fields used in a Jira install  ##########################################
 ########################################################################################################
 
-def get_fields():
-    response = requests.get(f'{jira_url}/rest/api/3/field', auth=auth)
-    if response.status_code == 200:
-        return response.json()
-    else:
+def get_fields(client, base_url):
+    try:
+        return client.get(f'{base_url}/rest/api/3/field')
+    except requests.RequestException:
         print("Failed to retrieve fields")
         return []
 
 
+########################################################################################################
+#####  shared HTTP client: pooled keep-alive session, retries with backoff and an adaptive rate limit  ##
+########################################################################################################
+class JiraClient:
+    ## status codes Jira (or a proxy in front of it) uses for throttling and transient failures; they are retried
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+    ## seconds it takes a throttled rate to climb back from zero to maxRate
+    RECOVERY_SECONDS = 60
+
+    def __init__(self, autho, headers, workers=4, maxRetries=5, requestsPerSecond=10):
+        ## one session for every call so connections (and TLS sessions) are reused across pages, threads and tickets
+        self.session = requests.Session()
+        self.session.auth = autho
+        self.session.headers.update(headers)
+        self.session.headers.update({"Accept": "application/json", "Accept-Encoding": "gzip, deflate"})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, workers) * 2)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.maxRetries = maxRetries
+        self.workers = max(1, workers)
+        ## token bucket: tokens refill at `rate` per second up to `maxRate` tokens; the rate is halved whenever Jira
+        ## throttles us and climbs back linearly with the time elapsed since (maxRate every RECOVERY_SECONDS), however
+        ## many calls succeed in the meantime
+        self.maxRate = float(requestsPerSecond)
+        self.rate = self.maxRate
+        self.tokens = self.maxRate
+        self.lastRefill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        ## block until the bucket holds a token, then take it
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                elapsed = now - self.lastRefill
+                self.tokens = min(self.maxRate, self.tokens + elapsed * self.rate)
+                self.rate = min(self.maxRate, self.rate + elapsed * self.maxRate / self.RECOVERY_SECONDS)
+                self.lastRefill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttled(self):
+        with self.lock:
+            self.rate = max(self.maxRate / 16, self.rate / 2)
+            self.tokens = 0
+
+    @staticmethod
+    def retryAfter(response, attempt):
+        ## seconds to wait before the next attempt: Retry-After (in seconds or as an HTTP date) when Jira sends it,
+        ## otherwise exponential backoff with jitter capped at a minute
+        value = response.headers.get("Retry-After") if response is not None else None
+        if value:
+            if value.strip().isdigit():
+                return float(value)
+            try:
+                retryDate = email.utils.parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                retryDate = None    ## malformed header, fall back to backing off
+            if retryDate is not None:
+                return max(0.0, (retryDate - datetime.datetime.now(retryDate.tzinfo)).total_seconds())
+        return min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
+
+    def get(self, url):
+        ## GET url and return its json, retrying throttled, failed and dropped requests up to maxRetries times
+        for attempt in range(self.maxRetries + 1):
+            self.acquire()
+            try:
+                response = self.session.get(url, timeout=60)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.maxRetries:
+                    raise
+                time.sleep(self.retryAfter(None, attempt))
+                continue
+            if response.status_code not in self.RETRY_STATUS_CODES:
+                response.raise_for_status()
+                return response.json()
+            if response.status_code == 429:
+                self.throttled()
+            if attempt == self.maxRetries:
+                response.raise_for_status()
+            print(f"Jira returned {response.status_code}, retrying ({attempt+1} of {self.maxRetries}).")
+            time.sleep(self.retryAfter(response, attempt))
+
+
+def createJiraClient(configData):
+    ## a client authorized with the API token in the creds file and tuned by the export settings of the config
+    headers = {
+        "Content-Type": "application/json",
+    }
+    secrets_data = api_access(configData['folderForCreds']+configData['credsFile'])
+    autho = HTTPBasicAuth(secrets_data['creds'][0]["userName"], secrets_data["creds"][0]["apiKey"])
+    return JiraClient(autho, headers,
+                      workers=configData.get('exportWorkers', 4),
+                      maxRetries=configData.get('exportMaxRetries', 5),
+                      requestsPerSecond=configData.get('exportRequestsPerSecond', 10))
+
+
+########################################################################################################
+#####  function to fetch search result pages concurrently while returning them in order  ##############
+########################################################################################################
+def fetchPagesInOrder(apiURLs, client, workers):
+    ## fetch the pages over a pool of worker threads and yield their json in the order of apiURLs, so the csv rows
+    ## are written in the same order as a one-page-at-a-time export. At most 2 pages per worker are held in memory
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = deque()
+        for apiURL in apiURLs:
+            pending.append(executor.submit(client.get, apiURL))
+            if len(pending) >= 2 * max(1, workers):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def fetchSearchPages(client, searchURL, workers, pageSize=100):
+    ## yield (passNumber, numberOfPasses, data) for every page of a search whose URL ends in "startAt=". The first
+    ## page tells us the total, so the startAt of every remaining page is known up front and those pages are fetched
+    ## concurrently, still in order
+    data = client.get(searchURL+str(0))
+    numberOfPasses = max(1, math.ceil(data["total"]/pageSize))
+    remainingURLs = [searchURL+str(passNumber*pageSize) for passNumber in range(1, numberOfPasses)]
+    for passNumber, data in enumerate(itertools.chain([data], fetchPagesInOrder(remainingURLs, client, workers))):
+        yield passNumber, numberOfPasses, data
+
+
 ########################################################################################################
 #####  function to open config files  ###################################################
 ########################################################################################################
@@ -65,21 +203,13 @@ def fixDate(dateToBeFixed):
 ########################################################################################################
 #####  function to determine the number of changes contained within each Jira ticket ###################
 ########################################################################################################
-def calculateHistorySize(statusHistories, historyLength, issueKey, autho, headers, base_url,jira_ticket_api_query, jira_ticket_api_end_point):
-    #revised logic to be implemented.
-    #1. need to receive ticket ID and length of the change history
-    #2. if length of status history is greater than 99, then we need to make another set of API calls to retrieve all change logs for the
+def calculateHistorySize(statusHistories):
     # calculate how many records within history contains updates to the status field
     sizeOfStatusRecords = []
     items_list = []
     stuffSize = 0
-    if historyLength > 100:
-        statusHistories = getIssueChangelogs(issueKey, historyLength, autho, headers, base_url, jira_ticket_api_end_point, jira_ticket_api_query)
-        sort_order = "ascend"
-    else:
-        sort_order = "desend"
-
-
+    ## the issue end point returns the change logs oldest first while the search end point returns them newest first;
+    ## calculateTimeInStatus sorts the transitions by date, so the order doesn't matter here
     stuffSize = len(statusHistories)
 
     for a in range(0,stuffSize,1):
@@ -90,36 +220,21 @@ def calculateHistorySize(statusHistories, historyLength, issueKey, autho, header
             if (isStatus == "status"):
                 sizeOfStatusRecords.append(a)
 
-    return sizeOfStatusRecords, statusHistories, sort_order
+    return sizeOfStatusRecords
 
 #################################################################################################################################
 #####  function to make additional API calls to get ticket change logs if there are more than 100 change logs ###################
 #################################################################################################################################
-def getIssueChangelogs(issueKey, historyLength, autho, headers, base_url, jira_ticket_api_end_point, jira_ticket_api_query):
-    issue_changelog_startat = 0
-    # divide that by 100 to determine the # of calls to make along with starting position
-    no_of_passes = math.ceil(historyLength/100)
-    loop_counter = 0
-    continue_loop= True
-    issue_changeLogs = []
-
-    while continue_loop:
-        # create the Api call url
-        api_end_point_to_call = base_url+jira_ticket_api_end_point+issueKey+jira_ticket_api_query+str(issue_changelog_startat)
-        # print(api_end_point_to_call)
-        # increment the loop counter
-        loop_counter += 1
-        issue_changelog_startat = issue_changelog_startat + 100
-
-        # make the api calls and append to the dictionary
-        response = requests.get(f"{api_end_point_to_call}", headers=headers, auth=autho)
-        temp = response.json()
-        issue_changeLogs.extend(temp["values"])
-
-        # return the dictionary values to the calculateHistorySize function
-
-        if loop_counter > no_of_passes-1:
-            continue_loop = False
+def getIssueChangelogs(historyLengths, client, base_url, jira_ticket_api_end_point, jira_ticket_api_query):
+    ## historyLengths maps the key of every ticket whose change logs didn't fit in the search result to its number of change logs.
+    ## the pages of all those tickets are fetched over one pool of client.workers threads (a long history no longer holds up
+    ## the rest of the page) and merged back per ticket in ascending startAt order
+    changeLogPages = [(issueKey, startAt) for issueKey, historyLength in historyLengths.items() for startAt in range(0, historyLength, 100)]
+    apiURLs = [base_url+jira_ticket_api_end_point+issueKey+jira_ticket_api_query+str(startAt) for issueKey, startAt in changeLogPages]
+
+    issue_changeLogs = {issueKey: [] for issueKey in historyLengths}
+    for (issueKey, startAt), temp in zip(changeLogPages, fetchPagesInOrder(apiURLs, client, client.workers)):
+        issue_changeLogs[issueKey].extend(temp["values"])
 
     return (issue_changeLogs)
 
@@ -277,9 +392,6 @@ def run_export_tickets():
     issue_types = readConfigs['configData'][0]['excluded_issue_types']
     wip_category_included = readConfigs['configData'][0]['wip_categories_included']
 
-    path_for_secrets = readConfigs['configData'][0]['folderForCreds']
-    fileName_for_secrets = readConfigs['configData'][0]['credsFile']
-
     ### create the URL of the REST API endpoint you want to access
     ### don't delete or modify the following two lines (unless Atlassian publishes a new end point/version)
     base_url = readConfigs['configData'][0]['base_url']
@@ -289,83 +401,115 @@ def run_export_tickets():
     ### if you add additional fields remember to update the myData.append lines across all functions to ensure the fields gets exported
     # jql = "&fields=key,summary, created, issuetype, status, parent, labels, fixVersions,components,customfield_10007,resolutiondate,assignee&sorter/order=ASC&maxResults=1000&startAt="
 
-    recordPullStartAt = 0
-    passNumber = 0
-    ticketsLoop = True                  ## set defatult value - used to loop through the API if total tickets > 1000
-    writeMode = "w"                     ## default creation of csv file a new file using the flag "w"
+    ### number of pages fetched from Jira at the same time
+    exportWorkers = readConfigs['configData'][0].get('exportWorkers', 4)
 
-    # Set up the headers & authorization with the API token
-    headers = {
-        "Content-Type": "application/json",
-        }
-    secrets_data = []
-    secrets_data = api_access(path_for_secrets+fileName_for_secrets)
-    api_user = secrets_data['creds'][0]["userName"]
-    api_token = secrets_data["creds"][0]["apiKey"]
-    autho = HTTPBasicAuth(api_user, api_token)
-
-    ### the JIRA API end point is configured to return only 100 tickets. the while statement loops to return all tickets in increments of 100
-    while ticketsLoop:
-        ##create the dynamic API URL
-        apiURL = base_url+project_api_endpoint+project+jql+str(recordPullStartAt)
-        ## send the API request and receive the json response
-        response = requests.get(f"{apiURL}", headers=headers, auth=autho)
-        data = response.json()
-
-        ## get project level information
-        totalJiraTickets = data["total"]                        ## find the total # of Jira tickets
-        ticketIDStartAt = data["startAt"]                       ## starting point of exporting Jira ticket within the API
-        totalRecords = len(data["issues"])                      ## total actual Jira tickets exported in the API
-        firstIssueKey = data["issues"][0]["key"]                ## determine the first issue id in the API's result
-        lastIssuekey = data["issues"][totalRecords-1]["key"]    ## determine the last issue id in the API's result
-        if totalRecords <= maxResultsForAPICalls:               ## needed for the last API call
-            totalRecords = maxResultsForAPICalls
+    # Set up the client with the API token
+    client = createJiraClient(readConfigs['configData'][0])
 
-        numberOfPasses = math.ceil(totalJiraTickets/totalRecords)       ## determine how many times to call the API for each jira project
+    ### the JIRA API end point is configured to return only 100 tickets, so the tickets are fetched a page at a time
+    for passNumber, numberOfPasses, data in fetchSearchPages(client, base_url+project_api_endpoint+project+jql, exportWorkers, maxResultsForAPICalls):
         if passNumber == 0:
-            print("Total Jira tickets = ",totalJiraTickets, ".\n")
+            print("Total Jira tickets = ",data["total"], ".\n")    ## the first page tells us the total # of Jira tickets
             ## un-comment the two lines below if you need the json file
             ##with open(destinationPath+jsonFileName, 'w', encoding='utf-8') as f:
             ##    json.dump(data, f, ensure_ascii=False, indent=6)
+        totalRecords = len(data["issues"])                      ## total actual Jira tickets exported in the API
+        firstIssueKey = data["issues"][0]["key"]                ## determine the first issue id in the API's result
+        lastIssuekey = data["issues"][totalRecords-1]["key"]    ## determine the last issue id in the API's result
 
         print (f"Pass {passNumber+1}  of {numberOfPasses}.")
         print(f"{totalRecords} tickets being exported starting at ticket {firstIssueKey} and last ticket {lastIssuekey}.")
 
-
-        ## call the export to CSV function from the json
-
+        ## call the export to CSV function from the json, creating a new file for the first page and appending the rest in order
+        writeMode = "w" if passNumber == 0 else "a"
         export_tickets(data,destination,writeMode,csvFileHeading)
 
-        ### check if all tickets have been exported.
-        if passNumber < numberOfPasses - 1:
-            recordPullStartAt = recordPullStartAt + 100
-            passNumber = passNumber+1
-            writeMode = 'a'
-        else:
-            ### exit the loop if all the tickets have been exported
-            ticketsLoop = False
+########################################################################################################
+#####  function to calculate the time spent in each status from the raw transition events of a page ####
+########################################################################################################
+def calculateTimeInStatus(transitionEvents, tickets):
+    ## vectorized over the whole page: sort the events by ticket and timestamp, then the time in the "from" status is
+    ## the difference to the ticket's previous transition (or to its created date for the first one), in days
+    transitions = pd.DataFrame(transitionEvents, columns=['ticket','changeID','created','fromStatus','toStatus'])
+    if transitions.empty:
+        return transitions.assign(transitionDate=pd.Series(dtype='datetime64[ns]'), timeInStatus=[], wipAge=[])
+
+    ## same standardization as fixDate: drop the 'T' and the time zone offset
+    transitions['transitionDate'] = pd.to_datetime(transitions['created'].str.replace('T',' ').str[:-5].str.strip(), format='%Y-%m-%d %H:%M:%S.%f')
+    transitions = transitions.sort_values(['ticket','transitionDate','changeID'], kind='stable').reset_index(drop=True)
+
+    createdDates = pd.Series([ticket[4] for ticket in tickets])
+    previousDates = transitions.groupby('ticket')['transitionDate'].shift(1)
+    previousDates = previousDates.fillna(transitions['ticket'].map(createdDates))
+    timeInStatus = ((transitions['transitionDate'] - previousDates).dt.total_seconds() / 86400).round(2)
+    ## transitions within moments of each other count as a quarter of a day
+    transitions['timeInStatus'] = timeInStatus.where(timeInStatus >= 0.001, 0.25)
+
+    ## age in the current status, recorded on the last transition of tickets that aren't Done
+    currentStatuses = pd.Series([ticket[3] for ticket in tickets])
+    lastTransition = ~transitions['ticket'].duplicated(keep='last') & (transitions['ticket'].map(currentStatuses) != "Done")
+    wipAge = np.ceil((datetime.datetime.now() - transitions['transitionDate']).dt.total_seconds() / 86400)
+    transitions['wipAge'] = wipAge.where(lastTransition, 0).astype(int)
+    return transitions
 
-def export_change_logs( data, destination, writeMode,autho, headers, base_url,jira_ticket_api_query, jira_ticket_api_end_point):
+########################################################################################################
+#####  normalized export format: a tickets table, a slim transitions table and a status lookup table ###
+########################################################################################################
+## the tables are written next to the change log csv, e.g. jira_tickets.csv, jira_transitions.csv and jira_statuses.csv
+normalizedTicketHeaders = ["Jira Key","Summary","IssueType","Current Status","Ticket Created On","Release","Components","Labels","Sprint","Date Completed","Epic Link","Age in the last WIP Status","WIP Category","Done Year","Done Week","Done Year Week"]
+normalizedTransitionHeaders = ["Jira Key","From status code","To status code","Date changed","Time in From Status (days)","Jira Change ID"]
+
+def normalizedPaths(destination):
+    ## returns the paths of the tickets, transitions and statuses tables for a change log csv path
+    base = os.path.splitext(destination)[0]
+    return base+'_tickets.csv', base+'_transitions.csv', base+'_statuses.csv'
+
+def statusCode(statusCodes, statusName):
+    ## integer code of a status name, assigning the next free code to names not seen before
+    if statusName is None:
+        return None
+    return statusCodes.setdefault(statusName, len(statusCodes))
+
+def write_status_codes(destination, statusCodes):
+    ## write the status lookup table before each page's tables, replacing the old one in a single step, so the lookup
+    ## always covers every code already in the transitions table even if the export is interrupted
+    _, _, statusesFile = normalizedPaths(destination)
+    with open(statusesFile+'.tmp', 'w', encoding='utf-8', newline='') as csvFile:
+        writer = csv.writer(csvFile)
+        writer.writerow(["Status Code","Status"])
+        writer.writerows(sorted((code, name) for name, code in statusCodes.items()))
+    os.replace(statusesFile+'.tmp', statusesFile)
+
+def export_change_logs( data, destination, writeMode, client, base_url,jira_ticket_api_query, jira_ticket_api_end_point, exportFormat="denormalized", statusCodes=None):
 
     destinationFile = destination
     appendMode = writeMode
     myData = []
+    normalized = exportFormat == "normalized"
+    ticketRows = []
+    transitionRows = []
+    tickets = []            ## fields of every ticket on the page
+    transitionEvents = []   ## raw status transitions: ticket position, change ID, timestamp, from status, to status
 
     bugCount = 0
     totalRecords = len(data["issues"]) ## total actual Jira tickets exported in the API
     ## append headers to csv file
     if (appendMode == 'w'):
         myData = [["Jira Key","Summary","IssueType","Current Status","Ticket Created On", "From status", "To status", "Date changed","Time in From Status (days)","Release","Components","Labels","Sprint","Date Completed","Epic Link","Age in the last WIP Status","Jira Change ID", "WIP Category","Done Year", "Done Week", "Done Year Week"]]
+        ticketRows = [normalizedTicketHeaders]
+        transitionRows = [normalizedTransitionHeaders]
+
+    ## the search end point returns at most 100 change logs per ticket, fetch the rest for the whole page at once
+    historyLengths = {issue["key"]: issue["changelog"]["total"] for issue in data["issues"] if issue["changelog"]["total"] > len(issue["changelog"]["histories"])}
+    fullChangeLogs = getIssueChangelogs(historyLengths, client, base_url, jira_ticket_api_end_point, jira_ticket_api_query)
 
     # iterate through every ticket
     for x in range(0,totalRecords,1):
         ## Initialize variables
-        historyLength = 0
         componentsList = []
         releaseList = []
         currentSprint = []
-        listOfStatusRecords = []
-        WIPageinCurrentStatus = 0
         done_year = 0
         done_week = 0
         year_week = 0
@@ -375,11 +519,8 @@ def export_change_logs( data, destination, writeMode,autho, headers, base_url,ji
         issueKey = data["issues"][x]["key"]
         ## capture the issue summary
         issueSummary = data["issues"][x]["fields"]["summary"]
-        ## get all ticket history into a list
-        statHistories = data["issues"][x]["changelog"]["histories"]
-        ## calculate the lengh of the history list
-        downloadedHistoryLength = len(data["issues"][x]["changelog"]["histories"])
-        historyLength = data["issues"][x]["changelog"]["total"]
+        ## get all ticket history into a list, including the change logs fetched separately for long histories
+        statHistories = fullChangeLogs.get(issueKey, data["issues"][x]["changelog"]["histories"])
         ## find out the current status of the Jira ticket
         currentStatus = data["issues"][x]["fields"]["status"]["name"]
         ## capture the issue type (epic, story, task, subtask)
@@ -434,90 +575,55 @@ def export_change_logs( data, destination, writeMode,autho, headers, base_url,ji
 
 
         ## from the history list, find out which ones contain Workflow transition status
-        ## ticketChangeLog is the revised list of change histories for tickets with more than 100 change records
-        status_history_exists = True
-        listOfStatusRecords, ticketChangeLog, sort_order = calculateHistorySize(statHistories, historyLength, issueKey,autho, headers, base_url,jira_ticket_api_query, jira_ticket_api_end_point)
-        ## get the length of the list that contain the transition status locations
-
-        lengthOfRecord = len(listOfStatusRecords)
-        if lengthOfRecord == 0:
-            status_history_exists = False
-            ## capture items in the backlog without any change history
-            fromStatus = data["issues"][x]["fields"]["status"]["name"]
-            WIPageinCurrentStatus = calculateWIP(dateCreated)
-            changeID = 0
-            ## print ("issue key when history length = 0", issueKey, " and x is ",x)
-            myData.append([issueKey,issueSummary, issueType, currentStatus, dateCreated,fromStatus,None,None,None,releaseList,componentsList,labels,currentSprint,None,epicLink,WIPageinCurrentStatus,changeID, wipCategory, done_year, done_week,year_week])
-
-        while status_history_exists:
-            # what is the sort order of the change log history
-            # if there are less than 100 records in the change log, it's part of the original data pull ..
-            # ...and the order when using that API is descending
-            # otherwise the order is ascending when using the ISSUE end point
-            if sort_order =="desend":
-                for_loop_param_a = lengthOfRecord -1
-                for_loop_param_b = -1
-                for_loop_param_c = -1
-            elif sort_order == "ascend":
-                for_loop_param_a = 0
-                for_loop_param_b = lengthOfRecord
-                for_loop_param_c = 1
-
-            # Now to find the indexes with the change records and calculate time in the From state
-            ######################## Apr 22 Update ################################
-            ##### update on the logic to calculate time in each state
-            # go through each change ID
-            # if "z"" matches listOfStatusRecords value
-            # for the first hit, subtract date - created date
-            # store previous date somewhere
-            # for subsequent hits subtract the created date - store previous date somewhere
-
-            # iterate through the listOfStatusRecords - it contains the index of the status changes
-            for z in range(for_loop_param_a,for_loop_param_b,for_loop_param_c):
-                # starting position of the index counter
-                value_of_index = listOfStatusRecords[z]
-
-                changeID = ticketChangeLog[value_of_index]["id"]
-                transitionDate = ticketChangeLog[value_of_index]["created"]
-                transitionDate = fixDate(transitionDate)
-                # find out how many items are within one change ID
-                len_of_last_item = len(ticketChangeLog[value_of_index]["items"])
-
-                # for the last status update record
-                if (sort_order == "desend" and z == 0) or (sort_order == "ascend" and z == lengthOfRecord -1):
-                    status_history_exists = False
-                    fromStatus = ticketChangeLog[value_of_index]["items"][len_of_last_item-1]["fromString"]
-                    toStatus = ticketChangeLog[value_of_index]["items"][len_of_last_item-1]["toString"]
-                    if (currentStatus != "Done"):
-                        WIPageinCurrentStatus = calculateWIP(transitionDate)
-                else:
-                    fromStatus = ticketChangeLog[value_of_index]["items"][len_of_last_item-1]["fromString"]
-                    toStatus = ticketChangeLog[value_of_index]["items"][len_of_last_item-1]["toString"]
-
-                # if this is the first change record, then time in status = transition date - date created
-                if z == for_loop_param_a:
-                    timeInStatus = transitionDate - dateCreated
-                else:
-                    # getting the transition date of the previous record depends on the order in which records are pulled
-                    if sort_order == "desend":
-                        previous_value_of_index = listOfStatusRecords[z+1]
-                    elif sort_order == "ascend":
-                        previous_value_of_index = listOfStatusRecords[z-1]
-                    previous_transition_date = ticketChangeLog[previous_value_of_index]["created"]
-                    previous_transition_date = fixDate(previous_transition_date)
-                    timeInStatus = transitionDate - previous_transition_date
-                # convert time to days
-                timeInStatus = round(timeInStatus.total_seconds()/86400,2)
-                if timeInStatus < 0.001:
-                    timeInStatus = 0.25
-
+        listOfStatusRecords = calculateHistorySize(statHistories)
+        ticketChangeLog = statHistories
 
-                #append the row to the csv file
-                myData.append([issueKey,issueSummary, issueType, currentStatus, dateCreated,fromStatus,toStatus,transitionDate,timeInStatus,releaseList,componentsList,labels,currentSprint,doneDate,epicLink,WIPageinCurrentStatus,changeID,wipCategory, done_year, done_week, year_week])
+        ## emit one raw event per status transition; the time in each status is computed for the whole page at once below
+        for value_of_index in listOfStatusRecords:
+            lastItem = ticketChangeLog[value_of_index]["items"][-1]
+            transitionEvents.append([x, int(ticketChangeLog[value_of_index]["id"]), ticketChangeLog[value_of_index]["created"], lastItem["fromString"], lastItem["toString"]])
 
+        tickets.append([issueKey,issueSummary, issueType, currentStatus, dateCreated,releaseList,componentsList,labels,currentSprint,doneDate,epicLink,wipCategory, done_year, done_week, year_week])
 
+    ## time in each status, in ticket order and then chronological order
+    transitions = calculateTimeInStatus(transitionEvents, tickets)
+    transitionsByTicket = {ticketPosition: group for ticketPosition, group in transitions.groupby('ticket', sort=False)}
 
-            ######################## Apr 22 Update ################################
+    for x, (issueKey,issueSummary, issueType, currentStatus, dateCreated,releaseList,componentsList,labels,currentSprint,doneDate,epicLink,wipCategory, done_year, done_week, year_week) in enumerate(tickets):
+        ticketTransitions = transitionsByTicket.get(x)
+        if ticketTransitions is None:
+            ## capture items in the backlog without any change history
+            fromStatus = currentStatus
+            WIPageinCurrentStatus = calculateWIP(dateCreated)
+            changeID = 0
+            if normalized:
+                transitionRows.append([issueKey,statusCode(statusCodes, fromStatus),None,None,None,changeID])
+            else:
+                myData.append([issueKey,issueSummary, issueType, currentStatus, dateCreated,fromStatus,None,None,None,releaseList,componentsList,labels,currentSprint,None,epicLink,WIPageinCurrentStatus,changeID, wipCategory, done_year, done_week,year_week])
+        else:
+            WIPageinCurrentStatus = 0
+            for changeID, transitionDate, fromStatus, toStatus, timeInStatus, WIPageinCurrentStatus in zip(
+                    ticketTransitions['changeID'], ticketTransitions['transitionDate'].dt.to_pydatetime(), ticketTransitions['fromStatus'],
+                    ticketTransitions['toStatus'], ticketTransitions['timeInStatus'], ticketTransitions['wipAge']):
+                #append the row to the csv file
+                if normalized:
+                    transitionRows.append([issueKey,statusCode(statusCodes, fromStatus),statusCode(statusCodes, toStatus),transitionDate,timeInStatus,changeID])
+                else:
+                    myData.append([issueKey,issueSummary, issueType, currentStatus, dateCreated,fromStatus,toStatus,transitionDate,timeInStatus,releaseList,componentsList,labels,currentSprint,doneDate,epicLink,WIPageinCurrentStatus,changeID,wipCategory, done_year, done_week, year_week])
+
+        ## the ticket's fields are written once, with its age in the last WIP status (only set on its last transition)
+        if normalized:
+            ticketRows.append([issueKey,issueSummary, issueType, currentStatus, dateCreated,releaseList,componentsList,labels,currentSprint,
+                               doneDate if ticketTransitions is not None else None,epicLink,WIPageinCurrentStatus,wipCategory, done_year, done_week, year_week])
+
+    if normalized:
+        write_status_codes(destinationFile, statusCodes)
+        ticketsFile, transitionsFile, _ = normalizedPaths(destinationFile)
+        for tableFile, tableRows in ((ticketsFile, ticketRows), (transitionsFile, transitionRows)):
+            with open(tableFile, appendMode, encoding='utf-8', newline='') as csvFile:
+                writer = csv.writer(csvFile)
+                writer.writerows(tableRows)
+        return
 
     ## open the CSV file
     csvFile = open(destinationFile, appendMode, encoding='utf-8', newline='')
@@ -539,9 +645,6 @@ def run_export_changelogs():
     project = readConfigs['configData'][0]['project']
     destination = destPath+destFileName
 
-    path_for_secrets = readConfigs['configData'][0]['folderForCreds']
-    fileName_for_secrets = readConfigs['configData'][0]['credsFile']
-
     ### get the api end point parameters if we need to make change log calls for issues whose change logs exceed 100 (max returned results)
     jira_ticket_api_end_point = readConfigs["configData"][0]["jql_issue_api_endpoint"]
     jira_ticket_api_query = readConfigs["configData"][0]["jql_issue_changelog_query"]
@@ -551,72 +654,224 @@ def run_export_changelogs():
     base_url = readConfigs['configData'][0]['base_url']
     project_api_endpoint = readConfigs['configData'][0]['api_end_point']
     jql_changelog_query = readConfigs['configData'][0]['jql_changelog_query']
+    ### "normalized" writes a tickets table and a slim transitions table with integer-coded statuses instead of one row per transition
+    exportFormat = readConfigs['configData'][0].get('exportFormat', 'denormalized')
+    statusCodes = {}
     ### if you add additional fields remember to update the myData.append lines across all functions to ensure the fields gets exported
     # jql_changelog_query = "&fields=key,summary, created, issuetype, status, parent, labels, fixVersions,components,customfield_10007,resolutiondate&sorter/order=ASC&type=story&maxResults=1000&expand=changelog&startAt="
 
-    recordPullStartAt = 0
-    passNumber = 0
-    ticketsLoop = True                  ## set defatult value - used to loop through the API if total tickets > 1000
-    writeMode = "w"                     ## default creation of csv file a new file using the flag "w"
+    ### number of pages fetched from Jira at the same time
+    exportWorkers = readConfigs['configData'][0].get('exportWorkers', 4)
 
     ## check if the value of maxREsultsForAPICalls will result in too many API calls. Stop executing rest of the code
     if maxResultsForAPICalls<100:
         print("#####################################################################")
         print("The value of 'maxResultsForAPICalls' is less than 100. This will result in too many API calls to Atlassian. Please validate this number and update the code.")
         print("#####################################################################")
-        ticketsLoop = False
+        return
 
-    # Set up the headers & authorization with the API token
-    headers = {
-        "Content-Type": "application/json",
-    }
+    # Set up the client with the API token
+    client = createJiraClient(readConfigs['configData'][0])
 
-    secrets_data = []
-    secrets_data = api_access(path_for_secrets+fileName_for_secrets)
-    api_user = secrets_data['creds'][0]["userName"]
-    api_token = secrets_data["creds"][0]["apiKey"]
-    autho = HTTPBasicAuth(api_user, api_token)
-
-    ### the JIRA API end point is configured to return only 100 tickets. the while statement loops to return all tickets in increments of 100
-    while ticketsLoop:
-        ##create the dynamic API URL
-        apiURL = base_url+project_api_endpoint+project+jql_changelog_query+str(recordPullStartAt)
-
-        ## print (apiURL)
-        ## send the API request and receive the json response
-        response = requests.get(f"{apiURL}", headers=headers, auth=autho)
-        data = response.json()
-
-        ## get project level information
-        totalJiraTickets = data["total"]                        ## find the total # of Jira tickets
-        ticketIDStartAt = data["startAt"]                       ## starting point of exporting Jira ticket within the API
-        totalRecords = len(data["issues"])                      ## total actual Jira tickets exported in the API
-        firstIssueKey = data["issues"][0]["key"]                ## determine the first issue id in the API's result
-        lastIssuekey = data["issues"][totalRecords-1]["key"]    ## determine the last issue id in the API's result
-        if totalRecords <= maxResultsForAPICalls:               ## needed for the last API call
-            totalRecords = maxResultsForAPICalls
-        numberOfPasses = math.ceil(totalJiraTickets/totalRecords)       ## determine how many times to call the API for each jira project
+    ### the JIRA API end point is configured to return only 100 tickets, so the tickets are fetched a page at a time
+    for passNumber, numberOfPasses, data in fetchSearchPages(client, base_url+project_api_endpoint+project+jql_changelog_query, exportWorkers, maxResultsForAPICalls):
         if passNumber == 0:
-            print(f"Only tickets with ChangeLogs being downloaded = {totalJiraTickets}."
+            print(f"Only tickets with ChangeLogs being downloaded = {data['total']}."
               " Actual tickets slated for the release may be higher. ")
             ## un-comment the two lines below if you need the json file
             ##with open(destinationPath+jsonFileName, 'w', encoding='utf-8') as f:
             ##    json.dump(data, f, ensure_ascii=False, indent=6)
+        totalRecords = len(data["issues"])                      ## total actual Jira tickets exported in the API
+        firstIssueKey = data["issues"][0]["key"]                ## determine the first issue id in the API's result
+        lastIssuekey = data["issues"][totalRecords-1]["key"]    ## determine the last issue id in the API's result
 
         print ("Pass ",passNumber+1, " of ",numberOfPasses)
         print("Changelogs in json = ",totalRecords, "starting at ticket ",firstIssueKey, "and last ticket ",lastIssuekey)
 
-        ## call the export to CSV function form the json
-        export_change_logs(data,destination,writeMode,autho, headers, base_url, jira_ticket_api_query, jira_ticket_api_end_point)
+        ## call the export to CSV function from the json, creating a new file for the first page and appending the rest in order
+        writeMode = "w" if passNumber == 0 else "a"
+        export_change_logs(data,destination,writeMode, client, base_url, jira_ticket_api_query, jira_ticket_api_end_point, exportFormat, statusCodes)
+
+
+    return
+
+########################################################################################################
+#####  single pass: one search sweep with the fields of both exports and the change logs expanded,  ####
+#####  writing both csv files from each page                                                        ####
+########################################################################################################
+def run_export_single_pass():
+    ### number of results for API calls your Jira install is configured to return
+    maxResultsForAPICalls = 100
+    readConfigs = read_config(configPath)
+    configData = readConfigs['configData'][0]
+    project = configData['project']
+    destPath = configData['csvFolderPath']
+    ticketsDestination = destPath+configData['csv_list_of_tickets']
+    destination = destPath+configData['csvFileName']
+    csvFileHeading = configData['fields_without_changelogs']
+    exportFormat = configData.get('exportFormat', 'denormalized')
+    exportWorkers = configData.get('exportWorkers', 4)
+    statusCodes = {}
+
+    base_url = configData['base_url']
+    project_api_endpoint = configData['api_end_point']
+    jira_ticket_api_end_point = configData["jql_issue_api_endpoint"]
+    jira_ticket_api_query = configData["jql_issue_changelog_query"]
+    jql = combinedSearchQuery(configData['jql_query'], configData['jql_changelog_query'])
+
+    client = createJiraClient(configData)
+
+    ## both files are built from the same page, so they always describe the same snapshot of the project
+    for passNumber, numberOfPasses, data in fetchSearchPages(client, base_url+project_api_endpoint+project+jql, exportWorkers, maxResultsForAPICalls):
+        if passNumber == 0:
+            print("Total Jira tickets = ",data["total"], ".\n")
+        print (f"Pass {passNumber+1}  of {numberOfPasses}.")
+        writeMode = "w" if passNumber == 0 else "a"
+        export_tickets(data,ticketsDestination,writeMode,csvFileHeading)
+        export_change_logs(data,destination,writeMode, client, base_url, jira_ticket_api_query, jira_ticket_api_end_point, exportFormat, statusCodes)
 
-        ### check if all tickets have been exported.
-        if passNumber < numberOfPasses - 1:
-            recordPullStartAt = recordPullStartAt + 100
-            passNumber = passNumber+1
-            writeMode = 'a'
-        else:
-            ### exit the loop if all the tickets have been exported
-            ticketsLoop = False
+
+    return
+
+########################################################################################################
+#####  delta sync: fetch only the tickets updated since the last sync into a local store and  ##########
+#####  regenerate both csv files from it                                                      ##########
+########################################################################################################
+def combinedSearchQuery(jql_query, jql_changelog_query):
+    ## one search query asking for the union of the fields of both exports, with the change logs expanded
+    fields = []
+    for query in (jql_query, jql_changelog_query):
+        queryParameters = urllib.parse.parse_qs(query.lstrip('&'))
+        for field in queryParameters.get('fields', [''])[0].split(','):
+            if field.strip() and field.strip() not in fields:
+                fields.append(field.strip())
+    return "&fields="+",".join(fields)+"&expand=changelog&maxResults=100&startAt="
+
+def openTicketStore(storeFile):
+    ## tickets keyed by Jira Key (position keeps the order they were first exported in) and their change logs keyed by change ID
+    os.makedirs(os.path.dirname(storeFile) or '.', exist_ok=True)
+    store = sqlite3.connect(storeFile)
+    store.executescript("""
+        CREATE TABLE IF NOT EXISTS tickets (jira_key TEXT PRIMARY KEY, position INTEGER NOT NULL, fields TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS histories (change_id INTEGER PRIMARY KEY, jira_key TEXT NOT NULL, history TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS histories_by_ticket ON histories (jira_key);
+        CREATE TABLE IF NOT EXISTS sync (name TEXT PRIMARY KEY, value TEXT);
+    """)
+    return store
+
+def upsertTickets(store, data, client, base_url, jira_ticket_api_end_point, jira_ticket_api_query):
+    ## insert new tickets at the end, replace the fields of known ones and add or replace their change logs
+    historyLengths = {}
+    for issue in data["issues"]:
+        issueKey = issue["key"]
+        store.execute("""INSERT INTO tickets (jira_key, position, fields) VALUES (?, (SELECT COALESCE(MAX(position), -1) + 1 FROM tickets), ?)
+                         ON CONFLICT (jira_key) DO UPDATE SET fields = excluded.fields""", (issueKey, json.dumps(issue["fields"])))
+        histories = issue["changelog"]["histories"]
+        historyLength = issue["changelog"]["total"]
+        storedHistories = store.execute("SELECT COUNT(*) FROM histories WHERE jira_key = ?", (issueKey,)).fetchone()[0]
+        ## the search end point only returns the newest 100 change logs; older ones are fetched unless the store already has them
+        if historyLength > len(histories) and storedHistories + len(histories) < historyLength:
+            historyLengths[issueKey] = historyLength
+        store.executemany("INSERT OR REPLACE INTO histories (change_id, jira_key, history) VALUES (?, ?, ?)",
+                          [(int(history["id"]), issueKey, json.dumps(history)) for history in histories])
+
+    for issueKey, histories in getIssueChangelogs(historyLengths, client, base_url, jira_ticket_api_end_point, jira_ticket_api_query).items():
+        store.executemany("INSERT OR REPLACE INTO histories (change_id, jira_key, history) VALUES (?, ?, ?)",
+                          [(int(history["id"]), issueKey, json.dumps(history)) for history in histories])
+
+def fetchProjectKeys(client, searchURL, workers, pageSize=100):
+    ## yield the key of every ticket the search returns, asking Jira for the key field only
+    for _, _, data in fetchSearchPages(client, searchURL+f"&fields=key&maxResults={pageSize}&startAt=", workers, pageSize):
+        for issue in data["issues"]:
+            yield issue["key"]
+
+def removeMissingTickets(store, liveKeys):
+    ## delete the stored tickets (and their change logs) that are no longer in liveKeys, returning how many were removed
+    store.execute("CREATE TEMP TABLE IF NOT EXISTS live_keys (jira_key TEXT PRIMARY KEY)")
+    store.execute("DELETE FROM live_keys")
+    store.executemany("INSERT OR IGNORE INTO live_keys (jira_key) VALUES (?)", ((key,) for key in liveKeys))
+    store.execute("DELETE FROM histories WHERE jira_key NOT IN (SELECT jira_key FROM live_keys)")
+    removed = store.execute("DELETE FROM tickets WHERE jira_key NOT IN (SELECT jira_key FROM live_keys)").rowcount
+    store.execute("DELETE FROM live_keys")
+    return removed
+
+def storedPages(store, pageSize=100):
+    ## yield the stored tickets in search result format, pageSize tickets at a time, in the order they were first exported
+    lastPosition = -1
+    while True:
+        rows = store.execute("SELECT jira_key, position, fields FROM tickets WHERE position > ? ORDER BY position LIMIT ?", (lastPosition, pageSize)).fetchall()
+        if not rows:
+            return
+        issues = []
+        for issueKey, position, fields in rows:
+            histories = [json.loads(history) for (history,) in store.execute(
+                "SELECT history FROM histories WHERE jira_key = ? ORDER BY change_id DESC", (issueKey,))]
+            issues.append({"key": issueKey, "fields": json.loads(fields), "changelog": {"histories": histories, "total": len(histories)}})
+        lastPosition = rows[-1][1]
+        yield {"issues": issues}
+
+def run_delta_sync():
+    ### number of results for API calls your Jira install is configured to return
+    maxResultsForAPICalls = 100
+    readConfigs = read_config(configPath)
+    configData = readConfigs['configData'][0]
+    project = configData['project']
+    destPath = configData['csvFolderPath']
+    ticketsDestination = destPath+configData['csv_list_of_tickets']
+    destination = destPath+configData['csvFileName']
+    csvFileHeading = configData['fields_without_changelogs']
+    storeFile = configData.get('deltaStorePath', destPath+'jira_store.sqlite')
+    exportFormat = configData.get('exportFormat', 'denormalized')
+    exportWorkers = configData.get('exportWorkers', 4)
+    reconcileDays = configData.get('deltaReconcileDays', 7)
+    statusCodes = {}
+
+    base_url = configData['base_url']
+    project_api_endpoint = configData['api_end_point']
+    jira_ticket_api_end_point = configData["jql_issue_api_endpoint"]
+    jira_ticket_api_query = configData["jql_issue_changelog_query"]
+    jql = combinedSearchQuery(configData['jql_query'], configData['jql_changelog_query'])
+
+    client = createJiraClient(configData)
+
+    store = openTicketStore(storeFile)
+    lastSync = store.execute("SELECT value FROM sync WHERE name = 'lastSync'").fetchone()
+    syncStarted = datetime.datetime.now(datetime.timezone.utc)
+    if lastSync is None:
+        print("No previous sync found, exporting all tickets into the store.")
+    else:
+        ## JQL dates are read in the Jira user's time zone, so go back 14 hours (the largest UTC offset) from the
+        ## last sync; tickets fetched twice are simply upserted again
+        since = datetime.datetime.fromisoformat(lastSync[0]) - datetime.timedelta(hours=14)
+        jql = urllib.parse.quote(f' AND updated >= "{since:%Y-%m-%d %H:%M}"') + jql
+        print(f"Exporting tickets updated since {lastSync[0]}.")
+
+    for passNumber, numberOfPasses, data in fetchSearchPages(client, base_url+project_api_endpoint+project+jql, exportWorkers, maxResultsForAPICalls):
+        if passNumber == 0:
+            print(f"Tickets to sync = {data['total']}.")
+        print (f"Pass {passNumber+1}  of {numberOfPasses}.")
+        upsertTickets(store, data, client, base_url, jira_ticket_api_end_point, jira_ticket_api_query)
+
+    ## only move the sync point forward once every updated ticket is in the store
+    store.execute("INSERT OR REPLACE INTO sync (name, value) VALUES ('lastSync', ?)", (syncStarted.isoformat(),))
+    store.commit()
+
+    ## deleted tickets and tickets moved out of the project never show up as updated, so every reconcileDays days
+    ## fetch the project's keys alone and drop the stored tickets that are missing from it
+    lastReconcile = store.execute("SELECT value FROM sync WHERE name = 'lastReconcile'").fetchone()
+    if lastSync is None or lastReconcile is None or syncStarted - datetime.datetime.fromisoformat(lastReconcile[0]) >= datetime.timedelta(days=reconcileDays):
+        if lastSync is not None:
+            removed = removeMissingTickets(store, fetchProjectKeys(client, base_url+project_api_endpoint+project, exportWorkers))
+            print(f"Removed {removed} tickets no longer in the project from the store.")
+        store.execute("INSERT OR REPLACE INTO sync (name, value) VALUES ('lastReconcile', ?)", (syncStarted.isoformat(),))
+        store.commit()
+
+    ## regenerate both csv files from the store, a page of tickets at a time
+    for passNumber, data in enumerate(storedPages(store)):
+        writeMode = "w" if passNumber == 0 else "a"
+        export_tickets(data,ticketsDestination,writeMode,csvFileHeading)
+        export_change_logs(data,destination,writeMode, client, base_url, jira_ticket_api_query, jira_ticket_api_end_point, exportFormat, statusCodes)
+    store.close()
 
     return
 
@@ -664,7 +919,16 @@ def strip_json(jira_description):
 ####################################################################################################
 ####################################################################################################
 
-print(f'Exporting all Jira tickets without Change Logs.........................')
-run_export_tickets()
-print(f'\nExporting all Change Logs .........................\n Might take a bit longer depending on history size for each ticket...')
-run_export_changelogs()
+if __name__ == '__main__':
+    configData = read_config(configPath)['configData'][0]
+    if configData.get('deltaSync', 'no').lower() == 'yes':
+        print(f'Syncing Jira tickets updated since the last export.........................')
+        run_delta_sync()
+    elif configData.get('singlePassExport', 'no').lower() == 'yes':
+        print(f'Exporting all Jira tickets and their Change Logs in one pass.........................')
+        run_export_single_pass()
+    else:
+        print(f'Exporting all Jira tickets without Change Logs.........................')
+        run_export_tickets()
+        print(f'\nExporting all Change Logs .........................\n Might take a bit longer depending on history size for each ticket...')
+        run_export_changelogs()
@@ -18,6 +18,17 @@ import sys
 import os
 import ast  # Import the 'ast' module for literal evaluation
 import math
+import hashlib
+import io
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    # Optional: keeps a columnar Parquet copy of each export for fast, column-projected loads
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
 
 # Step 1: Configuration Management
 class ConfigManager:
@@ -50,36 +61,470 @@ class ConfigManager:
 
 
 # Step 2: Data Management
-class DataManager:
+class ColumnarCache:
+    """
+    A Parquet copy of a Jira export CSV, kept next to it. List columns (Release, Components, Labels, Sprint) are
+    stored as native list columns and categorical columns as dictionary-encoded columns. The copy is rebuilt
+    only when the CSV's modification time and content hash change, and is read with memory mapping and column
+    projection. Only used when pyarrow is installed.
+    """
+    LIST_COLUMNS = ['Release', 'Components', 'Labels', 'Sprint']
+
+    # Bumped whenever the layout of the Parquet copy changes, so older copies are rebuilt
+    FORMAT_VERSION = 2
+
+    def __init__(self, csv_path, read_csv):
+        self.csv_path = csv_path
+        self.read_csv = read_csv  # Parses the CSV with its declared schema
+        self.parquet_path = os.path.splitext(csv_path)[0] + '.parquet'
+        self.meta_path = self.parquet_path + '.json'
+
     @staticmethod
-    def read_csv(file_path, releases, exclude_from_status, issue_types, wip_category_included, excluded_epics,change_log):
+    def available():
+        return pq is not None
+
+    def _csv_hash(self):
+        sha256 = hashlib.sha256()
+        with open(self.csv_path, 'rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b''):
+                sha256.update(block)
+        return sha256.hexdigest()
+
+    def _is_fresh(self):
+        """The cache is fresh if the CSV's mtime is unchanged, or if it changed but the content hash did not."""
+        if not (os.path.exists(self.parquet_path) and os.path.exists(self.meta_path)):
+            return False
+        with open(self.meta_path, 'r') as file:
+            meta = json.load(file)
+
+        if meta.get('version') != self.FORMAT_VERSION:
+            return False
+        csv_mtime = os.path.getmtime(self.csv_path)
+        if meta.get('mtime') == csv_mtime:
+            return True
+        if meta.get('sha256') == self._csv_hash():
+            self._write_meta(csv_mtime, meta['sha256'])
+            return True
+        return False
+
+    def _write_meta(self, csv_mtime, csv_hash):
+        with open(self.meta_path, 'w') as file:
+            json.dump({'version': self.FORMAT_VERSION, 'mtime': csv_mtime, 'sha256': csv_hash}, file)
+
+    def _rebuild(self):
+        df = self.read_csv(self.csv_path)
+        for column in self.LIST_COLUMNS:
+            if column in df.columns:
+                df[column] = df[column].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) else [])
+
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), self.parquet_path)
+        self._write_meta(os.path.getmtime(self.csv_path), self._csv_hash())
+
+    def read(self, columns=None):
+        """Returns the requested columns of the export, rebuilding the cache first if the CSV has changed."""
+        if not self._is_fresh():
+            self._rebuild()
+        if columns is not None:
+            available = pq.read_schema(self.parquet_path).names
+            columns = [column for column in columns if column in available]
+        return pq.read_table(self.parquet_path, columns=columns, memory_map=True).to_pandas()
+
+
+class NormalizedExport:
+    """
+    A change log exported in the normalized format: a tickets table keyed by Jira Key, a slim transitions table with
+    integer-coded statuses and a status lookup table, written next to the change log CSV (jira.csv becomes
+    jira_tickets.csv, jira_transitions.csv and jira_statuses.csv). The tables are joined back into change log rows
+    only when the change log is loaded, and only for the columns asked for.
+    """
+    TRANSITION_COLUMNS = ['Jira Key', 'From status', 'To status', 'Date changed', 'Time in From Status (days)', 'Jira Change ID']
+    STATUS_CODE_COLUMNS = {'From status': 'From status code', 'To status': 'To status code'}
+
+    def __init__(self, csv_path):
+        base = os.path.splitext(csv_path)[0]
+        self.csv_path = csv_path
+        self.tickets_path = base + '_tickets.csv'
+        self.transitions_path = base + '_transitions.csv'
+        self.statuses_path = base + '_statuses.csv'
+
+    def is_current(self):
+        """True if the normalized tables exist and are newer than any denormalized export at the CSV path."""
+        if not all(os.path.exists(path) for path in (self.tickets_path, self.transitions_path, self.statuses_path)):
+            return False
+        return not os.path.exists(self.csv_path) or os.path.getmtime(self.transitions_path) >= os.path.getmtime(self.csv_path)
+
+    def _split_columns(self, columns):
+        """Splits the requested change log columns into transitions table and tickets table columns."""
+        transition_columns = [self.STATUS_CODE_COLUMNS.get(column, column) for column in self.TRANSITION_COLUMNS if columns is None or column in columns]
+        ticket_columns = None if columns is None else ['Jira Key'] + [column for column in columns if column not in self.TRANSITION_COLUMNS]
+        return transition_columns, ticket_columns
+
+    def _statuses(self):
+        """Status names in code order."""
+        return pd.read_csv(self.statuses_path).sort_values('Status Code')['Status'].tolist()
+
+    def join(self, transitions, tickets, statuses):
+        """
+        Decodes the transitions' status codes into categoricals and adds each transition's ticket columns. A ticket's
+        age in its last WIP status is kept on its last transition only, as in the denormalized export, so `transitions`
+        must hold all the transitions of its tickets.
+        """
+        for column, code_column in self.STATUS_CODE_COLUMNS.items():
+            if code_column in transitions.columns:
+                codes = pd.to_numeric(transitions.pop(code_column)).fillna(-1).astype(int)
+                transitions[column] = pd.Categorical.from_codes(codes, categories=statuses)
+        last_transition = ~transitions['Jira Key'].duplicated(keep='last').to_numpy()
+        df = transitions.merge(tickets, on='Jira Key', how='left')
+        if 'Age in the last WIP Status' in df.columns:
+            df['Age in the last WIP Status'] = df['Age in the last WIP Status'].where(last_transition, 0)
+        df['Jira Key'] = df['Jira Key'].astype('category')
+        return df
+
+    def read(self, columns=None):
+        transition_columns, ticket_columns = self._split_columns(columns)
+        return self.join(Dataset._read(self.transitions_path, transition_columns), Dataset._read(self.tickets_path, ticket_columns), self._statuses())
+
+    def read_chunks(self, columns, chunk_size):
+        """
+        Streams the transitions table in chunks, joining each chunk with the (much smaller) tickets table. The rows of
+        the last Jira Key in a chunk are held back for the next one, so every ticket's transitions are joined together.
+        """
+        transition_columns, ticket_columns = self._split_columns(columns)
+        tickets = Dataset._read(self.tickets_path, ticket_columns)
+        statuses = self._statuses()
+        pending = None
+        for chunk in pd.read_csv(self.transitions_path, dtype=Dataset.SCHEMA, usecols=transition_columns, chunksize=chunk_size):
+            chunk = Dataset.apply_schema(chunk)
+            if pending is not None:
+                chunk = pd.concat([pending, chunk], ignore_index=True)
+            held_back = (chunk['Jira Key'] == chunk['Jira Key'].iloc[-1]).to_numpy()
+            pending = chunk[held_back]
+            if not held_back.all():
+                yield self.join(chunk[~held_back], tickets, statuses)
+        if pending is not None:
+            yield self.join(pending, tickets, statuses)
+
+
+class Dataset:
+    """
+    A Jira export loaded once per run. The CSV is parsed with an explicit schema and its Release lists are parsed
+    once, and every stage of DataManager filters the same frame with boolean masks instead of re-reading the file.
+    Only the columns the stages ask for are loaded; columns requested later are read and added on demand.
+    """
+    # Explicit dtypes for the columns of the two exports (columns missing from an export are ignored). Keys, statuses
+    # and categories repeat on every transition row, so they are stored as categoricals rather than Python strings
+    SCHEMA = {
+        'Jira Key': 'category',
+        'Summary': str,
+        'IssueType': 'category',
+        'Current Status': 'category',
+        'WIP Category': 'category',
+        'Epic Link': 'category',
+        'From status': 'category',
+        'To status': 'category',
+        'Done Year Week': str,
+        'Created Year Week': 'category',
+        'Time in From Status (days)': float
+    }
+
+    # Parsed into native datetime64 columns
+    DATE_COLUMNS = ['Ticket Created On', 'Date changed', 'Date Completed']
+
+    # Downcast to the smallest integer type that holds them
+    INTEGER_COLUMNS = ['Done Year', 'Done Week', 'Created Year', 'Created Week', 'Age in the last WIP Status', 'Jira Change ID']
+
+    # Free text and lists the calculations never use. Dropped on load unless asked for by name or keep_text_columns
+    # is set (main sets it when debugOutput is "yes", so the debug CSVs keep them)
+    TEXT_COLUMNS = ['Summary', 'Description', 'Components', 'Labels', 'Sprint']
+    keep_text_columns = False
+
+    # Columns the DataManager stages need from each export
+    TICKET_COLUMNS = ['Jira Key', 'IssueType', 'WIP Category', 'Release', 'Epic Link', 'Date Completed', 'Done Year', 'Done Week']
+    CHANGE_LOG_COLUMNS = ['Jira Key', 'IssueType', 'WIP Category', 'Release', 'From status', 'Time in From Status (days)', 'Jira Change ID']
+
+    # Exports already loaded in this run, by file path
+    _loaded = {}
+
+    def __init__(self, df, all_columns=True):
+        self.df = df
+        self.all_columns = all_columns  # False while only some of the export's columns have been loaded
+        self._indexes = {}  # Inverted index per column, built the first time a filter needs it
+
+    @classmethod
+    def load(cls, file_path, columns=None):
+        """
+        Returns the export at file_path, reading and parsing it only the first time it is requested. If `columns` is
+        given only those columns are read, and columns missing from an earlier load are added to the shared frame.
+        """
+        dataset = cls._loaded.get(file_path)
+        if columns is not None and cls.keep_text_columns:
+            columns = columns + [column for column in cls.TEXT_COLUMNS if column not in columns]
+
+        if dataset is None:
+            dataset = cls(cls._read(file_path, columns), all_columns=columns is None)
+            cls._loaded[file_path] = dataset
+        elif not dataset.all_columns:
+            # Add the columns that earlier loads didn't ask for (all of them when no columns are given)
+            missing = None if columns is None else [column for column in columns if column not in dataset.df.columns]
+            if missing is None or missing:
+                added = cls._read(file_path, missing)
+                added = added.drop(columns=[column for column in added.columns if column in dataset.df.columns])
+                dataset.df = pd.concat([dataset.df, added.set_index(dataset.df.index)], axis=1)
+                dataset.all_columns = columns is None
+        return dataset
+
+    @classmethod
+    def _read(cls, file_path, columns=None):
+        """
+        Reads columns of the export from its columnar cache when pyarrow is installed, otherwise from the CSV. A change
+        log exported in the normalized format is read from its tables and joined.
+        """
+        normalized = NormalizedExport(file_path)
+        if normalized.is_current():
+            return normalized.read(columns)
         try:
-            df = pd.read_csv(file_path)
+            if ColumnarCache.available():
+                df = ColumnarCache(file_path, cls._read_csv).read(columns)
+            else:
+                df = cls._read_csv(file_path, columns)
+                # Parse the Release lists once for every stage
+                if 'Release' in df.columns:
+                    df['Release'] = df['Release'].apply(ast.literal_eval)
         except FileNotFoundError:
-            print('The CSV file containing historical JIRA tickets can\'t be found')
+            print(f'The {file_path} file containing historical JIRA tickets can\'t be found.')
             sys.exit()
 
+        if columns is None and not cls.keep_text_columns:
+            df = df.drop(columns=[column for column in cls.TEXT_COLUMNS if column in df.columns])
+        return df
+
+    @classmethod
+    def _read_csv(cls, file_path, columns=None):
+        """Reads columns of the CSV with the declared schema."""
+        df = pd.read_csv(file_path, dtype=cls.SCHEMA, usecols=(lambda column: column in columns) if columns else None)
+        return cls.apply_schema(df)
+
+    @classmethod
+    def read_chunks(cls, file_path, columns, chunk_size):
+        """Yields the columns of the export `chunk_size` rows at a time, parsed like a full load."""
+        normalized = NormalizedExport(file_path)
+        if normalized.is_current():
+            yield from normalized.read_chunks(columns, chunk_size)
+            return
+        try:
+            reader = pd.read_csv(file_path, dtype=cls.SCHEMA, usecols=lambda column: column in columns, chunksize=chunk_size)
+        except FileNotFoundError:
+            print(f'The {file_path} file containing historical JIRA tickets can\'t be found.')
+            sys.exit()
+        for chunk in reader:
+            chunk = cls.apply_schema(chunk)
+            chunk['Release'] = chunk['Release'].apply(ast.literal_eval)
+            yield chunk
+
+    @classmethod
+    def apply_schema(cls, df):
+        """Parses the date columns and downcasts the integer columns of a frame read with SCHEMA."""
+        for column in cls.DATE_COLUMNS:
+            if column in df.columns:
+                df[column] = pd.to_datetime(df[column], format='ISO8601', errors='coerce')
+        for column in cls.INTEGER_COLUMNS:
+            if column in df.columns:
+                df[column] = pd.to_numeric(df[column], errors='coerce', downcast='integer')
+        return df
+
+    def index(self, column):
+        """
+        Returns the inverted index of an indexed column: a dict from each value (each fix version, for Release) to
+        the sorted row positions of the tickets holding it. The index is built once per load with one vectorized
+        pass, so every later filter on the column is a lookup rather than a scan of the frame.
+        """
+        index = self._indexes.get(column)
+        if index is None:
+            values = self.df[column].reset_index(drop=True)
+            if column == 'Release':
+                # One entry per (ticket, fix version) pair; tickets without a release become a single empty entry
+                values = values.explode()
+            positions = values.index.to_numpy()
+
+            codes, uniques = pd.factorize(values.to_numpy())
+            found = codes >= 0  # Skip empty values
+            codes, positions = codes[found], positions[found]
+
+            # Group the positions by value; the stable sort keeps each group's positions in ascending order
+            order = np.argsort(codes, kind='stable')
+            boundaries = np.cumsum(np.bincount(codes, minlength=len(uniques)))[:-1]
+            index = dict(zip(uniques, np.split(positions[order], boundaries)))
+            self._indexes[column] = index
+        return index
+
+    def positions(self, column, values):
+        """Sorted row positions of the tickets holding any of the values in an indexed column."""
+        if isinstance(values, str):
+            values = [values]
+        index = self.index(column)
+        matches = [index[value] for value in values if value in index]
+        return np.unique(np.concatenate(matches)) if matches else np.empty(0, dtype=np.int64)
+
+    def rows(self, releases=None, excluded_issue_types=None, excluded_epics=None):
+        """
+        Sorted row positions of the tickets in any of the releases (every ticket if none are given), less the
+        excluded issue types and epics, computed as set operations on the inverted indexes.
+        """
+        rows = self.positions('Release', releases) if releases else np.arange(len(self.df))
+        if excluded_issue_types:
+            rows = np.setdiff1d(rows, self.positions('IssueType', excluded_issue_types), assume_unique=True)
+        if excluded_epics:
+            rows = np.setdiff1d(rows, self.positions('Epic Link', excluded_epics), assume_unique=True)
+        return rows
+
+    def mask(self, rows):
+        """Boolean mask over the frame selecting the given row positions."""
+        mask = np.zeros(len(self.df), dtype=bool)
+        mask[rows] = True
+        return pd.Series(mask, index=self.df.index)
+
+    def all_rows(self):
+        return pd.Series(True, index=self.df.index)
+
+    def release_mask(self, release):
+        """Tickets tagged with the release (or any of a list of releases), or every ticket if no release is given."""
+        if not release:
+            return self.all_rows()
+        return self.mask(self.positions('Release', release))
+
+    def issue_type_mask(self, excluded_issue_types):
+        return self.mask(self.rows(excluded_issue_types=excluded_issue_types))
+
+    def wip_category_mask(self, wip_categories):
+        return self.df['WIP Category'].isin(wip_categories)
+
+    def epic_mask(self, excluded_epics):
+        return self.mask(self.rows(excluded_epics=excluded_epics))
+
+    def from_status_mask(self, excluded_from_status):
+        return ~self.df['From status'].isin(excluded_from_status or [])
+
+    def view(self, mask):
+        """Returns the rows selected by the mask."""
+        return self.df[mask]
+
+
+class AggregateStore:
+    """
+    Throughput and cycle-time aggregates of one export cached between runs. The store holds the aggregates of the
+    unfiltered export: the per-key, per-From status sums of Time in From Status, and each ticket's filter columns and
+    completion week. The configured filters are applied when the store is queried, so changing them doesn't rebuild
+    the store. It is a cache of the last export, not an incremental fold: an export that hasn't changed since the
+    store was built isn't read at all, and a changed export is aggregated again in full. Deleting the file forces a
+    rebuild.
+    """
+    # Bumped whenever the stored aggregates change meaning, so older stores are rebuilt
+    FORMAT_VERSION = 4
+
+    # Columns the queries filter the tickets on
+    FILTER_COLUMNS = ['Jira Key', 'Release', 'IssueType', 'WIP Category']
+    SUM_COLUMNS = ['Jira Key', 'From status', 'Time in From Status (days)']
+
+    def __init__(self, store_path, file_path):
+        key_inputs = {'file': file_path, 'version': self.FORMAT_VERSION}
+        key = hashlib.sha256(json.dumps(key_inputs, sort_keys=True).encode('utf-8')).hexdigest()
+        self.path = os.path.join(store_path, f"aggregates_{key}.json")
+        self.file_path = file_path
+        self.fingerprint = None
+        self.cycle_time_sums = pd.DataFrame(columns=self.SUM_COLUMNS)   # Time in each From status, per ticket
+        self.tickets = pd.DataFrame(columns=self.FILTER_COLUMNS)        # Filter columns of every exported ticket
+        self.completions = pd.DataFrame(columns=self.FILTER_COLUMNS + ['Week'])
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as file:
+                data = json.load(file)
+            self.fingerprint = data['fingerprint']
+            for name in ('cycle_time_sums', 'tickets', 'completions'):
+                setattr(self, name, pd.read_json(io.StringIO(data[name]), orient='split', dtype=False, convert_dates=False))
+
+    @staticmethod
+    def export_fingerprint(file_path):
+        """Size and modification time of the export and of its normalized tables, whichever exist."""
+        normalized = NormalizedExport(file_path)
+        paths = [file_path, normalized.tickets_path, normalized.transitions_path, normalized.statuses_path]
+        return [[path, os.path.getsize(path), os.path.getmtime(path)] for path in paths if os.path.exists(path)]
+
+    def is_current(self):
+        """True if the export hasn't changed since the store was built from it."""
+        return self.fingerprint == self.export_fingerprint(self.file_path)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        data = {name: getattr(self, name).to_json(orient='split', index=False) for name in ('cycle_time_sums', 'tickets', 'completions')}
+        with open(self.path, 'w') as file:
+            json.dump(dict(data, fingerprint=self.fingerprint), file)
+
+    @classmethod
+    def _ticket_columns(cls, df):
+        tickets = df[cls.FILTER_COLUMNS].drop_duplicates(subset='Jira Key').astype({'Jira Key': str, 'IssueType': object, 'WIP Category': object})
+        return tickets.reset_index(drop=True)
+
+    def build_change_log(self, df):
+        """Replaces the cycle-time sums and ticket columns with those of the unfiltered change log."""
+        self.tickets = self._ticket_columns(df)
+        self.cycle_time_sums = self._sum(pd.DataFrame({
+            'Jira Key': df['Jira Key'].astype(str).to_numpy(),
+            'From status': df['From status'].astype(object).to_numpy(),
+            'Time in From Status (days)': pd.to_numeric(df['Time in From Status (days)'], errors='coerce').to_numpy()
+        }))
+        self.fingerprint = self.export_fingerprint(self.file_path)
+
+    @classmethod
+    def _sum(cls, rows):
+        rows = rows.astype({'Time in From Status (days)': float})
+        return rows.groupby(['Jira Key', 'From status'], dropna=False, sort=False)['Time in From Status (days)'].sum().reset_index()
+
+    def build_completed(self, df):
+        """Replaces the completion weeks with those of the tickets the unfiltered ticket export has completed."""
+        completed_df = df[(df['WIP Category'] == 'Done') & df['Date Completed'].notna()].drop_duplicates(subset=['Jira Key', 'Done Year', 'Done Week'])
+        completions = completed_df[self.FILTER_COLUMNS].astype({'Jira Key': str, 'IssueType': object, 'WIP Category': object})
+        self.completions = completions.assign(Week=DataManager.week_ordinals(completed_df['Date Completed'])).reset_index(drop=True)
+        self.fingerprint = self.export_fingerprint(self.file_path)
+
+    @staticmethod
+    def _filter(df, releases, excluded_issue_types, wip_categories):
+        dataset = Dataset(df.reset_index(drop=True))
+        mask = dataset.mask(dataset.rows(releases, excluded_issue_types=excluded_issue_types)) & dataset.wip_category_mask(wip_categories)
+        return dataset, mask
+
+    def cycle_times(self, releases, excluded_issue_types, wip_categories, excluded_from_status):
+        """Per-ticket cycle times of the tickets matching the filters, in Jira Key order like DataManager.calculate_cycle_times."""
+        rows = self.cycle_time_sums.merge(self.tickets, on='Jira Key', how='inner')
+        dataset, mask = self._filter(rows, releases, excluded_issue_types, wip_categories)
+        rows = dataset.view(mask & dataset.from_status_mask(excluded_from_status))
+        return rows.groupby('Jira Key')['Time in From Status (days)'].sum().sort_index().to_numpy(dtype=float)
+
+    def completed_weeks(self, releases, excluded_issue_types, wip_categories):
+        """Week ordinal of every completed ticket matching the filters."""
+        dataset, mask = self._filter(self.completions, releases, excluded_issue_types, wip_categories)
+        return dataset.view(mask)['Week'].to_numpy(dtype=np.int64)
+
+
+class DataManager:
+    @staticmethod
+    def read_csv(file_path, releases, exclude_from_status, issue_types, wip_category_included, excluded_epics,change_log):
+        dataset = Dataset.load(file_path, Dataset.CHANGE_LOG_COLUMNS if change_log == "yes" else Dataset.TICKET_COLUMNS)
+
         # Filter by release and other conditions
-        if releases:
-            df['Release'] = df['Release'].apply(ast.literal_eval)
-            df = df[df['Release'].apply(lambda x: releases in x)]
-
-        # Apply initial filters
-        filtered_df = df[
-        df['WIP Category'].isin(wip_category_included) &
-        ~df['IssueType'].isin(issue_types)
-        ]
+        mask = (
+            dataset.mask(dataset.rows(releases, excluded_issue_types=issue_types)) &
+            dataset.wip_category_mask(wip_category_included)
+        )
 
         # Apply additional filter conditionally
         if change_log == "yes":
-            filtered_df = filtered_df[~filtered_df["From status"].isin(exclude_from_status)]
+            mask &= dataset.from_status_mask(exclude_from_status)
 
-        return filtered_df
+        return dataset.view(mask)
 
     @staticmethod
     def calculate_cycle_times(df,config):
         df['Time in From Status (days)'] = pd.to_numeric(df['Time in From Status (days)'], errors='coerce')
-        grouped = df.groupby('Jira Key')['Time in From Status (days)'].sum().reset_index()
+        grouped = df.groupby('Jira Key', observed=True)['Time in From Status (days)'].sum().reset_index()
         cycle_times = grouped['Time in From Status (days)'].values
 
         # Get the output path for the CSV from the configuration
@@ -91,40 +536,156 @@ class DataManager:
 
         return np.array(cycle_times)
 
+    @staticmethod
+    def week_ordinals(dates):
+        """Integer week numbers of datetime64 values: whole Monday-to-Sunday weeks since the Unix epoch."""
+        days = pd.to_datetime(dates).to_numpy(dtype='datetime64[D]').astype(np.int64)
+        return (days + 3) // 7  # 1970-01-01 was a Thursday, so shift by 3 days for weeks to start on Monday
+
+    @staticmethod
+    def week_start_dates(weeks):
+        """Monday of each week ordinal."""
+        return (np.asarray(weeks, dtype=np.int64) * 7 - 3).astype('datetime64[D]')
+
+    @staticmethod
+    def weekly_throughput(completed_weeks, end_week=None):
+        """
+        Dense weekly throughput from the week ordinals of completed tickets: one row per calendar week from the first
+        completion up to `end_week` (the current week by default), including the weeks where nothing was completed,
+        so a team that has stalled since its last completion shows those idle weeks. 'Jira Key' holds the count.
+        """
+        completed_weeks = np.asarray(completed_weeks, dtype=np.int64)
+        if not completed_weeks.size:
+            counts, weeks = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        else:
+            if end_week is None:
+                end_week = DataManager.week_ordinals([datetime.now()])[0]
+            first_week = completed_weeks.min()
+            counts = np.bincount(completed_weeks - first_week, minlength=max(end_week, completed_weeks.max()) - first_week + 1)
+            weeks = first_week + np.arange(counts.size)
+        return pd.DataFrame({
+            'Week': weeks,
+            'Week Start': DataManager.week_start_dates(weeks),
+            'Jira Key': counts,
+            'Takt Time': counts / 5
+        })
+
+    @staticmethod
+    def completed_weeks(df):
+        """Week ordinals of the completed tickets in the frame (each ticket counted once per completion week)."""
+        completed_df = df[(df['WIP Category'] == 'Done') & df['Date Completed'].notna()].drop_duplicates(subset=['Jira Key', 'Done Year', 'Done Week'])
+        return DataManager.week_ordinals(completed_df['Date Completed'])
+
     @staticmethod
     def calculate_avg_weekly_throughput(df, weeks_for_roll_avg):
-        completed_df = df[df['WIP Category'] == 'Done'].drop_duplicates(subset=['Jira Key', 'Done Year', 'Done Week'])
-        weekly_counts = completed_df.groupby('Done Year Week')['Jira Key'].count().reset_index()
-        weekly_counts['Takt Time'] = weekly_counts['Jira Key'] / 5
+        completed_weeks = DataManager.completed_weeks(df)
+        weekly_counts = DataManager.weekly_throughput(completed_weeks)
         
         rolling_median = weekly_counts['Jira Key'].tail(weeks_for_roll_avg).median()
-        return weekly_counts, rolling_median, len(completed_df)
+        return weekly_counts, rolling_median, len(completed_weeks)
     
+    @staticmethod
+    def has_recent_throughput(weekly_counts, weeks_for_roll_avg):
+        """
+        True if any ticket was completed in the last `weeks_for_roll_avg` weeks. The weekly throughput runs up to the
+        current week, so a stale export or a release that has stalled leaves a window of idle weeks to simulate from.
+        """
+        return bool(weekly_counts['Jira Key'].tail(int(weeks_for_roll_avg)).gt(0).any())
+
+    @staticmethod
+    def calculate_cycle_times_from_store(store, releases, exclude_from_status, issue_types, wip_category_included):
+        """Same as read_csv + calculate_cycle_times, rebuilding the store from the change log first if it has changed."""
+        if not store.is_current():
+            store.build_change_log(Dataset.load(store.file_path, Dataset.CHANGE_LOG_COLUMNS).df)
+            store.save()
+        return store.cycle_times(releases, issue_types, wip_category_included, exclude_from_status)
+
+    @staticmethod
+    def calculate_avg_weekly_throughput_from_store(store, releases, issue_types, wip_category_included, weeks_for_roll_avg):
+        """Same as read_csv + calculate_avg_weekly_throughput, rebuilding the store from the ticket export first if it has changed."""
+        if not store.is_current():
+            store.build_completed(Dataset.load(store.file_path, Dataset.TICKET_COLUMNS).df)
+            store.save()
+        completed_weeks = store.completed_weeks(releases, issue_types, wip_category_included)
+        weekly_counts = DataManager.weekly_throughput(completed_weeks)
+
+        rolling_median = weekly_counts['Jira Key'].tail(weeks_for_roll_avg).median()
+        return weekly_counts, rolling_median, len(completed_weeks)
+
+    @staticmethod
+    def read_csv_chunks(file_path, releases, exclude_from_status, issue_types, wip_category_included, change_log, chunk_size=100000):
+        """
+        Streaming counterpart of read_csv: reads the export `chunk_size` rows at a time, applies the same filters to
+        each chunk and yields the filtered chunks, so peak memory is bounded by the chunk size rather than the file size.
+        The rows of the last Jira Key in a chunk are held back and yielded with the next chunk, so every ticket's rows
+        reach the aggregations together and give exactly the same sums as the in-memory path.
+        """
+        columns = Dataset.CHANGE_LOG_COLUMNS if change_log == "yes" else Dataset.TICKET_COLUMNS
+
+        pending = None
+        for chunk in Dataset.read_chunks(file_path, columns, chunk_size):
+            dataset = Dataset(chunk)
+            mask = (
+                dataset.mask(dataset.rows(releases, excluded_issue_types=issue_types)) &
+                dataset.wip_category_mask(wip_category_included)
+            )
+            if change_log == "yes":
+                mask &= dataset.from_status_mask(exclude_from_status)
+            chunk = dataset.view(mask)
+
+            if pending is not None:
+                chunk = pd.concat([pending, chunk])
+            if chunk.empty:
+                pending = None
+                continue
+            held_back = chunk['Jira Key'] == chunk['Jira Key'].iloc[-1]
+            pending = chunk[held_back]
+            if not held_back.all():
+                yield chunk[~held_back]
+
+        if pending is not None:
+            yield pending
+
+    @staticmethod
+    def calculate_cycle_times_streaming(chunks, config):
+        """Same as calculate_cycle_times, folding per-key partial sums of each chunk instead of grouping one frame."""
+        full_output_path = os.path.join(config.get('csvFolderPath'), 'debug_step2-data_for_cycle_time_calcs.csv')
+
+        partial_sums = []
+        for i, chunk in enumerate(chunks):
+            chunk['Time in From Status (days)'] = pd.to_numeric(chunk['Time in From Status (days)'], errors='coerce')
+            partial_sums.append(chunk.groupby('Jira Key', observed=True)['Time in From Status (days)'].sum())
+
+            # Append the filtered chunk to the debug CSV
+            chunk.to_csv(full_output_path, mode='w' if i == 0 else 'a', header=i == 0)
+
+        if not partial_sums:
+            return np.array([])
+        # A key only spans chunks if its rows aren't contiguous in the export; combine its partial sums
+        cycle_times = pd.concat(partial_sums).groupby(level=0).sum()
+        return cycle_times.values
+
+    @staticmethod
+    def calculate_avg_weekly_throughput_streaming(chunks, weeks_for_roll_avg):
+        """Same as calculate_avg_weekly_throughput, collecting each chunk's completion weeks as integers."""
+        completed_weeks = [DataManager.completed_weeks(chunk) for chunk in chunks]
+        completed_weeks = np.concatenate(completed_weeks) if completed_weeks else np.zeros(0, dtype=np.int64)
+        weekly_counts = DataManager.weekly_throughput(completed_weeks)
+
+        rolling_median = weekly_counts['Jira Key'].tail(weeks_for_roll_avg).median()
+        return weekly_counts, rolling_median, len(completed_weeks)
+
     @staticmethod
     def sum_of_tickets(csv_file_name, releases, issue_types, excluded_epics, config_manager):
         """
         Sum the tickets based on filters and update the configuration file.
         """
-        try:
-            # Load the CSV file into a DataFrame
-            df = pd.read_csv(csv_file_name)
-        except FileNotFoundError:
-            print(f'The {csv_file_name} file containing historical JIRA tickets can\'t be found.')
-            sys.exit()
-
-        # Filter by release if specified
-        if releases:
-            df['Release'] = df['Release'].apply(ast.literal_eval)
-            df = df[df['Release'].apply(lambda x: releases in x)]
+        # Load the CSV file and filter by release if specified; the debug dump below gets every column when debugging
+        dataset = Dataset.load(csv_file_name, None if Dataset.keep_text_columns else Dataset.TICKET_COLUMNS)
+        df = dataset.view(dataset.release_mask(releases))
 
         # Apply filters to the DataFrame
-        filtered_df = df[
-            ((df['WIP Category'] == "Prioritized") | 
-             (df['WIP Category'] == "WIP") |
-             (df['WIP Category'] == "Backlog")) &
-            ~df['IssueType'].isin(issue_types) &
-            ~df["Epic Link"].isin(excluded_epics)
-        ]
+        filtered_df = DataManager.filter_remaining_tickets(df, issue_types, excluded_epics)
 
         # Get the output path for the CSV from the configuration
         output_csv_path = config_manager.get('csvFolderPath')
@@ -139,36 +700,43 @@ class DataManager:
         print(f"Remaining tickets: {remaining_tickets}")
 
         # Calculate final ticket count and update configuration
-        final_ticket_count = int(math.ceil(remaining_tickets * 1.10))
+        final_ticket_count = DataManager.final_ticket_count(remaining_tickets, config_manager.get('scopeBuffer', 0.10))
         config_manager.set('finalTicketCount', final_ticket_count)  # Update final ticket count
         print(f"Final ticket count (with buffer): {final_ticket_count}")
 
         return
     
+    @staticmethod
+    def final_ticket_count(remaining_tickets, scope_buffer):
+        """The remaining tickets plus the scope buffer for unknown unknowns, rounded up. This is what the forecasts simulate."""
+        return int(math.ceil(remaining_tickets * (1 + scope_buffer)))
+
+    @staticmethod
+    def filter_remaining_tickets(df, issue_types, excluded_epics):
+        """Returns the tickets that are still to be completed (Prioritized, WIP or Backlog), less excluded types and epics."""
+        return df[
+            ((df['WIP Category'] == "Prioritized") |
+             (df['WIP Category'] == "WIP") |
+             (df['WIP Category'] == "Backlog")) &
+            ~df['IssueType'].isin(issue_types) &
+            ~df["Epic Link"].isin(excluded_epics)
+        ]
+
     @staticmethod
     def calculate_takt_time_from_demand(config_manager):
         # Load the path from the configuration
         csv_file_path = config_manager.get('csvFolderPath') + config_manager.get('csv_list_of_tickets')
 
-        try:
-            df = pd.read_csv(csv_file_path)
-        except FileNotFoundError:
-            print(f'The file {csv_file_path} containing the list of tickets cannot be found.')
-            sys.exit()
-
-        # Filter out tickets not in the current release
-        releases = config_manager.get('release')
-        if releases:
-            df['Release'] = df['Release'].apply(ast.literal_eval)
-            df = df[df['Release'].apply(lambda x: releases in x)]
+        dataset = Dataset.load(csv_file_path, Dataset.TICKET_COLUMNS)
 
-        # Filter out specific ticket types
-        issue_types = config_manager.get('excluded_issue_types')
-        if issue_types:
-            df = df[~df['IssueType'].isin(issue_types)]
+        # Filter out tickets not in the current release and specific ticket types
+        df = dataset.view(
+            dataset.mask(dataset.rows(config_manager.get('release'), excluded_issue_types=config_manager.get('excluded_issue_types'))) &
+            dataset.wip_category_mask(['Done'])
+        )
 
-        # Calculate the number of tickets completed per week (Throughput)
-        completed_tickets_per_week = df[df['WIP Category'] == 'Done'].groupby('Done Year Week')['Jira Key'].count().mean()
+        # Calculate the number of tickets completed per week (Throughput), counting the weeks where none were
+        completed_tickets_per_week = DataManager.weekly_throughput(DataManager.completed_weeks(df))['Jira Key'].mean()
 
         # Ensure throughput is not zero
         if completed_tickets_per_week == 0:
@@ -210,54 +778,629 @@ class DataManager:
         return tickets_per_week
 
 # Step 3: Simulation
+class SimulationResult:
+    """
+    Weeks to complete stored as a histogram: counts[i] is the number of trials that took i weeks (or, for the exact
+    engine, the probability of taking i weeks). Percentile, min, mean and ECDF queries are answered from the counts.
+    """
+    def __init__(self, counts):
+        self.counts = np.asarray(counts)
+
+    @classmethod
+    def from_weeks(cls, weeks_to_complete):
+        """Builds the histogram from the weeks to complete of individual trials."""
+        return cls(np.bincount(np.asarray(weeks_to_complete, dtype=np.int64)))
+
+    @classmethod
+    def merge(cls, results):
+        """Adds the counts of several results together."""
+        size = max((result.counts.size for result in results), default=0)
+        return cls(sum((np.pad(result.counts, (0, size - result.counts.size)) for result in results), np.zeros(size, dtype=np.int64)))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['counts'])
+
+    def save(self, path):
+        """Writes the counts to a compact binary .npz file."""
+        np.savez_compressed(path, counts=self.counts)
+
+    @property
+    def weeks(self):
+        return np.arange(self.counts.size)
+
+    @property
+    def total(self):
+        return self.counts.sum()
+
+    def ecdf(self):
+        """Returns the weeks and the share of trials finished within each of them."""
+        return self.weeks, np.cumsum(self.counts) / self.total
+
+    @staticmethod
+    def percentile_index(cdf, percentile):
+        """Index of the first entry of a cumulative distribution that reaches the given percentage."""
+        return int(np.searchsorted(cdf, percentile / 100 - 1e-12))
+
+    def percentile(self, percentile):
+        """Returns the smallest number of weeks within which the given percentage of trials finished."""
+        _, cdf = self.ecdf()
+        return float(self.percentile_index(cdf, percentile))
+
+    def min(self):
+        return float(np.flatnonzero(self.counts)[0])
+
+    def mean(self):
+        return float(np.dot(self.weeks, self.counts) / self.total)
+
+
+class SimulationCache:
+    """
+    On-disk memoization of simulation results. Each result is stored as an .npz file named after the SHA-256 hash of
+    its inputs, and the least recently used files are evicted once the cache grows past its size limit.
+    """
+    def __init__(self, cache_path, max_size_mb=100):
+        self.cache_path = cache_path
+        self.max_size_bytes = max_size_mb * 1024 * 1024
+
+    @staticmethod
+    def make_key(inputs):
+        """Hashes a dictionary of simulation inputs into a content address."""
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def _file_path(self, key):
+        return os.path.join(self.cache_path, f"{key}.npz")
+
+    def get(self, key):
+        """Returns the cached (SimulationResult, adaptive stats) for the key, or None if it isn't cached."""
+        file_path = self._file_path(key)
+        if not os.path.exists(file_path):
+            return None
+
+        # Mark the entry as recently used
+        os.utime(file_path)
+        with np.load(file_path) as data:
+            adaptive_stats = json.loads(str(data['adaptive_stats']))
+            return SimulationResult(data['counts']), adaptive_stats
+
+    def put(self, key, result, adaptive_stats=None):
+        os.makedirs(self.cache_path, exist_ok=True)
+        np.savez_compressed(self._file_path(key), counts=result.counts, adaptive_stats=json.dumps(adaptive_stats))
+        self._evict()
+
+    def _evict(self):
+        """Removes the least recently used entries until the cache fits within its size limit."""
+        entries = [os.path.join(self.cache_path, name) for name in os.listdir(self.cache_path) if name.endswith('.npz')]
+        entries.sort(key=os.path.getmtime)
+        total_size = sum(os.path.getsize(entry) for entry in entries)
+        while entries and total_size > self.max_size_bytes:
+            oldest = entries.pop(0)
+            total_size -= os.path.getsize(oldest)
+            os.remove(oldest)
+
+    def invalidate(self):
+        """Removes every cached result and returns how many were removed."""
+        if not os.path.isdir(self.cache_path):
+            return 0
+        entries = [name for name in os.listdir(self.cache_path) if name.endswith('.npz')]
+        for name in entries:
+            os.remove(os.path.join(self.cache_path, name))
+        return len(entries)
+
+
 class MonteCarloSimulator:
+    # Trials per shard. Shards are the unit of work for the process pool, and their boundaries depend only on
+    # the number of trials so the same seed produces the same results whatever the number of workers
+    SHARD_SIZE = 50000
+
     @staticmethod
-    def run_simulation(weekly_takt_time_list, remaining_tickets, takt_time, weeks_for_roll_avg, config, n_simulations=10000):
+    def run_simulation(weekly_takt_time_list, remaining_tickets, takt_time, weeks_for_roll_avg, config, n_simulations=10000, seed=None, workers=1):
         """
         Run a Monte Carlo simulation to estimate the number of weeks required to complete the remaining tickets.
         This version uses historical data to simulate the completion time using the approach from Scrumage.
+        The trials are split into shards, each with its own random stream spawned from the seed, and the shards
+        are spread over `workers` processes.
+
+        Returns a SimulationResult holding the histogram of weeks to complete.
         """
 
         # Ensure weeks_for_roll_avg is an integer
         weeks_for_roll_avg = int(weeks_for_roll_avg)
 
-        # Initialize an array to store the weeks needed to complete in each simulation
-        weeks_to_complete = np.zeros(n_simulations)
-
         # Use the most recent throughput data based on the configured rolling average weeks
         historical_tickets_completed = np.array(weekly_takt_time_list['Jira Key'])[-weeks_for_roll_avg:]
 
-        for i in range(n_simulations):
-            # Initialize counters for simulation
-            remaining = remaining_tickets
-            weeks = 0
+        # Simulate the trials shard by shard with the vectorized batch engine
+        result = MonteCarloSimulator._run_shards(historical_tickets_completed, remaining_tickets, n_simulations, seed, workers)
 
-            while remaining > 0:
-                # Randomly sample from the historical ticket completions for each week
-                sampled_throughput = np.random.choice(historical_tickets_completed)
+        MonteCarloSimulator._save_debug(result, config, 'debug_step3_monte_carlo.npz')
 
-                # Deduct the sampled throughput from remaining tickets
-                remaining -= sampled_throughput
+        return result
 
-                # Increment the number of weeks required
-                weeks += 1
+    @staticmethod
+    def run_configured_engine(config, weekly_takt_time_list, cycle_time_history, takt_time):
+        """
+        Run the engine selected by 'simulationEngine' in the config. Results are memoized on disk, keyed by a hash of
+        every input that affects them, so a repeat run on unchanged exports loads the stored distribution instead.
+        Unseeded Monte Carlo runs are never cached since each of them is meant to be a fresh sample.
 
-            # Store the result
-            weeks_to_complete[i] = weeks
-        # Convert simulation results to a DataFrame
-        simulation_df = pd.DataFrame({'Weeks to Complete': weeks_to_complete})
+        Returns the SimulationResult and, for the adaptive engine, its convergence statistics (otherwise None).
+        """
+        engine = config.get('simulationEngine', 'monte_carlo')
+        # Forecast the remaining tickets plus the scope buffer, as the summary and the sensitivity sweep do
+        remaining_tickets = DataManager.final_ticket_count(config.get('remainingTicketCount'), config.get('scopeBuffer', 0.10))
+        weeks_for_roll_avg = int(config.get('rollingAvgWeeks'))
+        n_simulations = config.get('numberOfSimulations', 10000)
+        seed = config.get('simulationSeed')
+
+        # Every input that changes the result is part of the cache key, and only those: the exact engine draws no
+        # samples and the adaptive engine picks its own number of trials
+        key_inputs = {
+            'engine': engine,
+            'remaining_tickets': remaining_tickets,
+            'rolling_avg_weeks': weeks_for_roll_avg
+        }
+        if engine != 'exact':
+            key_inputs['seed'] = seed
+        if engine not in ('exact', 'adaptive'):
+            key_inputs['n_simulations'] = n_simulations
+        if engine == 'cycle_time':
+            key_inputs['history'] = np.asarray(cycle_time_history, dtype=float).tolist()
+            key_inputs['wip_limit'] = config.get('wipLimit', 5)
+        else:
+            key_inputs['history'] = np.array(weekly_takt_time_list['Jira Key'])[-weeks_for_roll_avg:].tolist()
+        if engine == 'adaptive':
+            key_inputs['confidence'] = str(config.get('confidenceLevels'))
+            key_inputs['adaptive'] = [config.get('adaptiveToleranceDays', 1), config.get('adaptiveChunkSize', 1000), config.get('adaptiveMaxSimulations', 1000000)]
+
+        cache = None
+        if config.get('simulationCache', 'yes') == 'yes' and (seed is not None or engine == 'exact'):
+            cache = SimulationCache(config.get('cachePath', os.path.join(config.get('csvFolderPath'), 'cache')), config.get('cacheMaxMB', 100))
+            cache_key = SimulationCache.make_key(key_inputs)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                print('Loaded the simulation result from the cache.')
+                # Write the same debug output as a fresh run would
+                debug_file = 'debug_step3_exact_distribution.npz' if engine == 'exact' else 'debug_step3_monte_carlo.npz'
+                MonteCarloSimulator._save_debug(cached[0], config, debug_file)
+                return cached
+
+        adaptive_stats = None
+        if engine == 'exact':
+            # Compute the exact distribution of weeks instead of sampling it
+            result = MonteCarloSimulator.exact_distribution(
+                weekly_takt_time_list,
+                remaining_tickets,
+                weeks_for_roll_avg,
+                config
+            )
+        elif engine == 'cycle_time':
+            # Schedule the remaining tickets through parallel WIP slots using the historical cycle times
+            result = MonteCarloSimulator.run_cycle_time_simulation(
+                cycle_time_history,
+                remaining_tickets,
+                config.get('wipLimit', 5),
+                config,
+                n_simulations=n_simulations,
+                seed=seed
+            )
+        elif engine == 'adaptive':
+            # Run only as many trials as the confidence percentile needs to converge
+            result, adaptive_stats = MonteCarloSimulator.run_adaptive_simulation(
+                weekly_takt_time_list,
+                remaining_tickets,
+                weeks_for_roll_avg,
+                config,
+                confidence=float(str(config.get('confidenceLevels')).strip('%')),
+                tolerance_days=config.get('adaptiveToleranceDays', 1),
+                chunk_size=config.get('adaptiveChunkSize', 1000),
+                max_simulations=config.get('adaptiveMaxSimulations', 1000000),
+                seed=seed,
+                workers=config.get('simulationWorkers', 1)
+            )
+        else:
+            result = MonteCarloSimulator.run_simulation(
+                weekly_takt_time_list,
+                remaining_tickets,
+                takt_time,  # Pass the Takt Time to the simulation
+                weeks_for_roll_avg,
+                config,
+                n_simulations=n_simulations,
+                seed=seed,
+                workers=config.get('simulationWorkers', 1)
+            )
+
+        if cache is not None:
+            cache.put(cache_key, result, adaptive_stats)
+
+        return result, adaptive_stats
+
+    @staticmethod
+    def _run_shards(historical_tickets_completed, remaining_tickets, n_simulations, seed=None, workers=1):
+        """Runs the trials in shards, each with an independent generator spawned from the seed, and merges their histograms."""
+        shard_sizes = [min(MonteCarloSimulator.SHARD_SIZE, n_simulations - start)
+                       for start in range(0, n_simulations, MonteCarloSimulator.SHARD_SIZE)]
+        seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        seed_sequences = seed_sequence.spawn(len(shard_sizes))
+        shards = [(historical_tickets_completed, remaining_tickets, shard_size, seed_sequence)
+                  for shard_size, seed_sequence in zip(shard_sizes, seed_sequences)]
+
+        if workers is None or workers < 1:
+            workers = os.cpu_count() or 1
+
+        if workers > 1 and len(shards) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as executor:
+                results = list(executor.map(MonteCarloSimulator._simulate_shard, *zip(*shards)))
+        else:
+            results = [MonteCarloSimulator._simulate_shard(*shard) for shard in shards]
+
+        return SimulationResult.merge(results)
+
+    @staticmethod
+    def _simulate_shard(historical_tickets_completed, remaining_tickets, n_simulations, seed_sequence):
+        """Runs one shard of trials with its own generator and returns its histogram. Worker processes call this by name."""
+        rng = np.random.default_rng(seed_sequence)
+        return SimulationResult.from_weeks(MonteCarloSimulator._simulate_weeks(historical_tickets_completed, remaining_tickets, n_simulations, rng))
+
+    @staticmethod
+    def _simulate_weeks(historical_tickets_completed, remaining_tickets, n_simulations, rng=np.random):
+        """
+        Vectorized batch engine. Weekly throughput is drawn in blocks as a (trials x weeks) matrix, the
+        cumulative sum of each row is searched for the week in which the remaining tickets are covered,
+        and the horizon is only extended for the trials that have not finished yet.
+        """
+        weeks_to_complete = np.zeros(n_simulations)
+        if remaining_tickets <= 0:
+            return weeks_to_complete
+
+        if np.max(historical_tickets_completed) <= 0:
+            raise ValueError('Historical throughput has no completed tickets, the remaining tickets can never be completed')
+
+        # Size the block so that most trials finish within the first draw
+        mean_throughput = max(np.mean(historical_tickets_completed), 1)
+        block_weeks = int(math.ceil(remaining_tickets / mean_throughput * 1.5)) + 1
+
+        active_trials = np.arange(n_simulations)        # trials that still have tickets left
+        completed_so_far = np.zeros(n_simulations)      # tickets completed by each active trial
+        weeks_elapsed = 0
+
+        while active_trials.size > 0:
+            # Draw a block of weekly throughput for every active trial
+            sampled_throughput = rng.choice(historical_tickets_completed, size=(active_trials.size, block_weeks))
+            cumulative = np.cumsum(sampled_throughput, axis=1) + completed_so_far[:, None]
+
+            # Cumulative throughput never decreases, so the crossing week is the count of weeks still short of the target
+            weeks_short = np.count_nonzero(cumulative < remaining_tickets, axis=1)
+            finished = weeks_short < block_weeks
+            weeks_to_complete[active_trials[finished]] = weeks_elapsed + weeks_short[finished] + 1
+
+            # Carry the unfinished trials over into the next block
+            completed_so_far = cumulative[~finished, -1]
+            active_trials = active_trials[~finished]
+            weeks_elapsed += block_weeks
 
-        # Save the DataFrame to a CSV file
-        output_csv_path = config.get('csvFolderPath')
-        simulation_df.to_csv(output_csv_path+'debug_step3_monte_carlo.csv', index=False)
-        
         return weeks_to_complete
 
+    @staticmethod
+    def run_adaptive_simulation(weekly_takt_time_list, remaining_tickets, weeks_for_roll_avg, config, confidence, tolerance_days,
+                                chunk_size=1000, max_simulations=1000000, seed=None, workers=1):
+        """
+        Run the Monte Carlo simulation in chunks until the estimate of the `confidence` percentile has converged.
+        After every chunk a 95% confidence interval for the percentile is read from the running histogram of weeks,
+        in fractional weeks, and the simulation stops once the interval is no wider than `tolerance_days` working
+        days. Each chunk is sharded over `workers` processes like run_simulation.
+
+        Returns a SimulationResult and a dictionary with the number of trials used and the final interval width
+        in working days.
+        """
+        weeks_for_roll_avg = int(weeks_for_roll_avg)
+        historical_tickets_completed = np.array(weekly_takt_time_list['Jira Key'])[-weeks_for_roll_avg:]
+
+        seed_sequence = np.random.SeedSequence(seed)
+        result = SimulationResult(np.zeros(0, dtype=np.int64))  # running histogram of weeks to complete
+        trials = 0
+        interval_width_days = float('inf')
+
+        while trials < max_simulations:
+            chunk_trials = min(chunk_size, max_simulations - trials)
+            chunk_result = MonteCarloSimulator._run_shards(historical_tickets_completed, remaining_tickets, chunk_trials, seed_sequence.spawn(1)[0], workers)
+            trials += chunk_trials
+
+            # Fold the chunk into the running histogram
+            result = SimulationResult.merge([result, chunk_result])
+
+            lower_weeks, upper_weeks = MonteCarloSimulator._percentile_interval(result.counts, confidence)
+            interval_width_days = (upper_weeks - lower_weeks) * 5
+            if interval_width_days <= tolerance_days:
+                break
+
+        MonteCarloSimulator._save_debug(result, config, 'debug_step3_monte_carlo.npz')
+
+        adaptive_stats = {
+            'trials': trials,
+            'interval_width_days': float(interval_width_days),
+            'converged': bool(interval_width_days <= tolerance_days)
+        }
+        return result, adaptive_stats
+
+    @staticmethod
+    def _percentile_interval(weeks_counts, percentile, z=1.96):
+        """
+        Distribution-free confidence interval for a percentile, read from a histogram of weeks. The bounds are the
+        order statistics whose ranks sit z standard deviations either side of the percentile's expected rank. Trials
+        finishing in week w are spread evenly over (w - 1, w], so the bounds are fractional weeks and the interval
+        keeps narrowing as trials are added instead of jumping between whole weeks.
+        """
+        n = int(weeks_counts.sum())
+        p = percentile / 100
+        half_width = z * math.sqrt(n * p * (1 - p))
+        lower_rank = min(max(n * p - half_width, 1), n)
+        upper_rank = min(max(n * p + half_width, 1), n)
+
+        cumulative = np.cumsum(weeks_counts)
+
+        def fractional_week(rank):
+            week = int(np.searchsorted(cumulative, rank))  # first week whose cumulative count reaches the rank
+            return week - 1 + (rank - (cumulative[week] - weeks_counts[week])) / weeks_counts[week]
+
+        return fractional_week(lower_rank), fractional_week(upper_rank)
+
+    @staticmethod
+    def _save_debug(result, config, file_name):
+        # Debug output is opt-in and saved as the compact histogram rather than one row per trial
+        if config.get('debugOutput', 'no') == 'yes':
+            output_csv_path = config.get('csvFolderPath')
+            result.save(os.path.join(output_csv_path, file_name))
+
+    @staticmethod
+    def exact_distribution(weekly_takt_time_list, remaining_tickets, weeks_for_roll_avg, config, tolerance=1e-12, max_weeks=10000):
+        """
+        Compute the exact probability distribution of the number of weeks required to complete the remaining tickets.
+        Weekly throughput is drawn from the same historical sample as run_simulation, so the weeks to complete are the
+        first-passage time of a random walk whose steps follow the empirical throughput PMF. The distribution is
+        built week by week by convolving the PMF with the probability of each ticket total still short of the target.
+
+        Returns a SimulationResult whose counts hold the probability of finishing in exactly i weeks. If the distribution
+        is cut off at `max_weeks`, the probability of taking longer is held in a last week, max_weeks + 1.
+        """
+        weeks_for_roll_avg = int(weeks_for_roll_avg)
+        historical_tickets_completed = np.array(weekly_takt_time_list['Jira Key'])[-weeks_for_roll_avg:].astype(int)
+
+        if remaining_tickets <= 0:
+            return SimulationResult(np.array([1.0]))
+
+        if np.max(historical_tickets_completed) <= 0:
+            raise ValueError('Historical throughput has no completed tickets, the remaining tickets can never be completed')
+
+        # Empirical PMF of weekly throughput
+        throughput_pmf = np.bincount(historical_tickets_completed) / historical_tickets_completed.size
+
+        # Probability of each ticket total that is still short of the target, kept as a window starting at `offset`
+        short_of_target = np.array([1.0])
+        offset = 0
+        survival = 1.0
+        weeks_distribution = [0.0]
+
+        while survival > tolerance and len(weeks_distribution) <= max_weeks:
+            # One more week of throughput, discarding the totals that reach the remaining tickets
+            short_of_target = np.convolve(short_of_target, throughput_pmf)[:max(remaining_tickets - offset, 0)]
+
+            # Trim negligible probability from both ends of the window to keep the convolution small
+            significant = np.flatnonzero(short_of_target > tolerance * 1e-3)
+            if significant.size == 0:
+                short_of_target = np.array([0.0])
+            else:
+                short_of_target = short_of_target[significant[0]:significant[-1] + 1]
+                offset += significant[0]
+
+            new_survival = short_of_target.sum()
+            weeks_distribution.append(survival - new_survival)
+            survival = new_survival
+
+        if survival > tolerance:
+            # Cut off at max_weeks: the chance of taking longer goes in one more week rather than being renormalized away
+            print(f'The exact forecast stopped at {max_weeks} weeks with a {survival:.2%} chance of taking longer, counted as week {max_weeks + 1}.')
+            weeks_distribution.append(survival)
+
+        weeks_distribution = np.array(weeks_distribution)
+        result = SimulationResult(weeks_distribution / weeks_distribution.sum())
+
+        MonteCarloSimulator._save_debug(result, config, 'debug_step3_exact_distribution.npz')
+
+        return result
+
+    @staticmethod
+    def run_cycle_time_simulation(cycle_time_history, remaining_tickets, wip_limit, config, n_simulations=10000, seed=None, chunk_tickets=100):
+        """
+        Simulate the remaining tickets flowing through `wip_limit` parallel WIP slots. Each ticket's duration is drawn
+        from the historical cycle times and it starts in whichever slot frees up first, so the weeks to complete are
+        the makespan of the schedule. Every trial is scheduled at once: each step assigns the next ticket of all
+        trials to their earliest free slot.
+
+        The historical cycle times are calendar days (the exporter's Time in From Status), so the makespan is turned
+        into whole calendar weeks of 7 days. Returns a SimulationResult like run_simulation.
+        """
+        cycle_time_history = np.asarray(cycle_time_history, dtype=float)
+        cycle_time_history = cycle_time_history[np.isfinite(cycle_time_history)]
+        if remaining_tickets > 0 and cycle_time_history.size == 0:
+            raise ValueError('There are no historical cycle times to simulate the remaining tickets with')
+
+        rng = np.random.default_rng(seed)
+        wip_limit = max(int(wip_limit), 1)
+        trials = np.arange(n_simulations)
+
+        # Calendar day on which each slot of each trial becomes free
+        slot_free_at = np.zeros((n_simulations, wip_limit))
+
+        for first_ticket in range(0, remaining_tickets, chunk_tickets):
+            # Draw the durations of a chunk of tickets for every trial at once
+            durations = rng.choice(cycle_time_history, size=(n_simulations, min(chunk_tickets, remaining_tickets - first_ticket)))
+            for duration in durations.T:
+                earliest_slot = np.argmin(slot_free_at, axis=1)
+                slot_free_at[trials, earliest_slot] += duration
+
+        makespan_days = np.max(slot_free_at, axis=1)
+        result = SimulationResult.from_weeks(np.ceil(makespan_days / 7))
+
+        MonteCarloSimulator._save_debug(result, config, 'debug_step3_monte_carlo.npz')
+
+        return result
+
+    @staticmethod
+    def run_how_many(weekly_takt_time_list, end_date, weeks_for_roll_avg, n_simulations=100000, seed=None):
+        """
+        Simulate how many tickets will be completed by the end date, drawing weekly throughput from the same
+        historical sample as run_simulation. Every trial draws one week from the sample for each whole week left
+        until the end date, so the number of times each historical week is drawn follows a multinomial
+        distribution and the total for all trials is one matrix product.
+
+        Returns an array with the number of tickets completed by the end date in each trial.
+        """
+        weeks_for_roll_avg = int(weeks_for_roll_avg)
+        historical_tickets_completed = np.array(weekly_takt_time_list['Jira Key'])[-weeks_for_roll_avg:]
+        rng = np.random.default_rng(seed)
+
+        # Whole weeks left until the end date
+        target_date = datetime.strptime(end_date, '%Y-%m-%d')
+        weeks_until_deadline = max((target_date - datetime.today()).days // 7, 0)
+
+        # Number of times each historical week is drawn in each trial
+        draws_per_week = rng.multinomial(weeks_until_deadline, np.full(historical_tickets_completed.size, 1 / historical_tickets_completed.size), size=n_simulations)
+        return draws_per_week @ historical_tickets_completed
+
+    @staticmethod
+    def run_sensitivity_grid(weekly_takt_time_list, remaining_tickets, rolling_avg_weeks_list, scope_buffers, n_simulations=10000, seed=None):
+        """
+        Simulate the weeks to complete for every combination of rolling average weeks and scope buffer using common
+        random numbers. One matrix of uniform random numbers is drawn up front and every grid cell turns it into
+        throughput draws from its own historical window, so differences between cells come from the parameters
+        rather than from sampling noise.
+
+        Returns a dictionary mapping (rolling average weeks, scope buffer) to that cell's SimulationResult.
+        """
+        rng = np.random.default_rng(seed)
+        throughput_history = np.array(weekly_takt_time_list['Jira Key'])
+        windows = {int(weeks): throughput_history[-int(weeks):] for weeks in rolling_avg_weeks_list}
+        targets = {buffer: DataManager.final_ticket_count(remaining_tickets, buffer) for buffer in scope_buffers}
+
+        if max(targets.values()) > 0 and min(np.max(window) for window in windows.values()) <= 0:
+            raise ValueError('Historical throughput has no completed tickets, the remaining tickets can never be completed')
+
+        # Draw the common random numbers once, long enough for the slowest window to reach the largest target
+        slowest_mean = max(min(np.mean(window) for window in windows.values()), 1)
+        horizon_weeks = int(math.ceil(max(targets.values()) / slowest_mean * 1.5)) + 1
+        uniforms = rng.random((n_simulations, horizon_weeks))
+
+        grid_results = {}
+        for weeks, window in windows.items():
+            # Map the shared uniforms onto this window's historical weeks, extending the shared draws if needed
+            paths = np.cumsum(window[(uniforms * window.size).astype(int)], axis=1)
+            while np.min(paths[:, -1]) < max(targets.values()):
+                uniforms = np.hstack([uniforms, rng.random((n_simulations, horizon_weeks))])
+                paths = np.cumsum(window[(uniforms * window.size).astype(int)], axis=1)
+
+            for buffer, target in targets.items():
+                weeks_to_complete = np.count_nonzero(paths < target, axis=1) + 1 if target > 0 else np.zeros(n_simulations)
+                grid_results[(weeks, buffer)] = SimulationResult.from_weeks(weeks_to_complete)
+
+        return grid_results
+
+    @staticmethod
+    def sample_throughput_paths(historical_tickets_completed, n_simulations, horizon_weeks, rng):
+        """Samples cumulative throughput paths as a (trials x weeks) matrix of tickets completed by the end of each week."""
+        sampled_throughput = rng.choice(historical_tickets_completed, size=(n_simulations, horizon_weeks))
+        return np.cumsum(sampled_throughput, axis=1)
+
+    @staticmethod
+    def run_portfolio_simulation(weekly_takt_time_list, remaining_ticket_counts, weeks_for_roll_avg, n_simulations=10000, seed=None):
+        """
+        Forecast several targets of one team from a single set of sampled cumulative throughput paths.
+        The paths are sampled once, long enough for the largest target, and each target's weeks to complete
+        are found with a vectorized crossing search against the shared paths.
+
+        Returns a list with the SimulationResult of each target, in the order of remaining_ticket_counts.
+        """
+        weeks_for_roll_avg = int(weeks_for_roll_avg)
+        historical_tickets_completed = np.array(weekly_takt_time_list['Jira Key'])[-weeks_for_roll_avg:]
+        rng = np.random.default_rng(seed)
+
+        largest_target = max(remaining_ticket_counts, default=0)
+        if largest_target > 0 and np.max(historical_tickets_completed) <= 0:
+            raise ValueError('Historical throughput has no completed tickets, the remaining tickets can never be completed')
+
+        # Sample the shared paths, extending the horizon until every trial has covered the largest target
+        mean_throughput = max(np.mean(historical_tickets_completed), 1)
+        horizon_weeks = int(math.ceil(largest_target / mean_throughput * 1.5)) + 1
+        paths = MonteCarloSimulator.sample_throughput_paths(historical_tickets_completed, n_simulations, horizon_weeks, rng)
+        while np.min(paths[:, -1]) < largest_target:
+            extension = MonteCarloSimulator.sample_throughput_paths(historical_tickets_completed, n_simulations, horizon_weeks, rng)
+            paths = np.hstack([paths, extension + paths[:, -1:]])
+
+        # Paths never decrease, so the crossing week is the count of weeks still short of the target
+        return [SimulationResult.from_weeks(np.count_nonzero(paths < remaining_tickets, axis=1) + 1 if remaining_tickets > 0 else np.zeros(n_simulations))
+                for remaining_tickets in remaining_ticket_counts]
+
 
 # Step 4 Generate Forecasts
+class ForecastResult:
+    """
+    A SimulationResult turned into delivery dates: the distribution of weeks to complete, the date the forecast is
+    anchored to and the working-day calendar (Monday to Friday, less holidays) that turns weeks of 5 working days
+    into dates. The cumulative distribution is computed once, and "date at probability p" and "probability of
+    finishing by date d" are both answered with a binary search on it.
+    """
+    def __init__(self, simulation, anchor_date=None, holidays=()):
+        self.simulation = simulation
+        self.anchor_date = np.datetime64(anchor_date or datetime.today().date(), 'D')
+        self.holidays = [str(np.datetime64(holiday, 'D')) for holiday in holidays]
+        self.calendar = np.busdaycalendar(holidays=self.holidays)
+        _, self.cdf = simulation.ecdf()
+
+    def weeks_at(self, probability):
+        """Smallest number of weeks within which `probability` percent of the trials finished."""
+        return SimulationResult.percentile_index(self.cdf, probability)
+
+    def date_for_weeks(self, weeks):
+        """The working day `weeks` weeks of 5 working days after the anchor date."""
+        return np.busday_offset(self.anchor_date, int(weeks) * 5, roll='forward', busdaycal=self.calendar).astype(object)
+
+    def date_at(self, probability):
+        """The date by which the remaining tickets are delivered with `probability` percent confidence."""
+        return self.date_for_weeks(self.weeks_at(probability))
+
+    def earliest_date(self):
+        return self.date_for_weeks(self.simulation.min())
+
+    def probability_by(self, date):
+        """Percentage of trials that finished on or before `date` (the inverse of date_at)."""
+        working_days = np.busday_count(self.anchor_date, np.datetime64(date, 'D'), busdaycal=self.calendar)
+        weeks = working_days // 5
+        if weeks < 0:
+            return 0.0
+        return float(self.cdf[min(weeks, len(self.cdf) - 1)] * 100)
+
+    def to_json(self):
+        return json.dumps({
+            'anchor_date': str(self.anchor_date),
+            'holidays': self.holidays,
+            'counts': self.simulation.counts.tolist()
+        })
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        return cls(SimulationResult(np.array(data['counts'])), data['anchor_date'], data['holidays'])
+
+    def save(self, path):
+        with open(path, 'w') as file:
+            file.write(self.to_json())
+
+
 class ForecastGenerator:
     def __init__(self, release, wip_category_included, exclude_from_status, issue_types, completed_tickets,
-                 median_cycle_time, std_dev, rolling_avg_completion_rate, confidence, remaining_tickets, weeks_to_complete, rolling_avg_weeks):
+                 median_cycle_time, std_dev, rolling_avg_completion_rate, confidence, remaining_tickets, forecast, rolling_avg_weeks,
+                 adaptive_stats=None, scope_buffer=0.10):
         self.release = release
         self.wip_category_included = wip_category_included
         self.exclude_from_status = exclude_from_status
@@ -268,16 +1411,14 @@ class ForecastGenerator:
         self.rolling_avg_completion_rate = rolling_avg_completion_rate
         self.confidence = confidence
         self.remaining_tickets = remaining_tickets
-        self.weeks_to_complete = weeks_to_complete
+        self.forecast = forecast  # ForecastResult of the selected engine
         self.rolling_avg_weeks = rolling_avg_weeks
+        self.adaptive_stats = adaptive_stats  # trials used and interval width when the adaptive simulation ran
+        self.scope_buffer = scope_buffer  # share of additional tickets added to the remaining ones for unknown unknowns
 
     def generate_summary(self):
-        # lower_bound_days = np.percentile(self.weeks_to_complete, 100-self.confidence) * 5
-        upper_bound_days = np.percentile(self.weeks_to_complete, self.confidence) * 5
-        lower_bound_days = np.min(self.weeks_to_complete)*5
-
-        inner_bound_date = datetime.today() + timedelta(days=lower_bound_days)
-        outer_bound_date = datetime.today() + timedelta(days=upper_bound_days)
+        inner_bound_date = self.forecast.earliest_date()
+        outer_bound_date = self.forecast.date_at(self.confidence)
 
         summary = (
             f"\nThe following empirical data for the Release: {self.release} is used to forecast release dates:\n"
@@ -287,9 +1428,15 @@ class ForecastGenerator:
             f"- {self.completed_tickets} tickets have been completed so far\n"
             f" -- with a median cycle time of {self.median_cycle_time:.2f} working days per ticket and standard deviation of {self.std_dev:.2f} working days\n"
             f" -- with a {self.rolling_avg_weeks} week rolling median of {self.rolling_avg_completion_rate:.2f} tickets/week\n\n"
-            f"Forecast: There's a {self.confidence}% chance that the remaining {self.remaining_tickets} (+10% additional tickets to account for unknown unknowns) tickets "
+            f"Forecast: There's a {self.confidence}% chance that the remaining {self.remaining_tickets} (+{self.scope_buffer:.0%} additional tickets to account for unknown unknowns) tickets "
             f"are expected to be delivered on or before {outer_bound_date.strftime('%d %B, %Y')}\n"
         )
+        if self.adaptive_stats is not None:
+            summary += (
+                f" -- based on {self.adaptive_stats['trials']:,} adaptive simulations; the 95% confidence interval of the "
+                f"{self.confidence}th percentile is {self.adaptive_stats['interval_width_days']:.1f} working days wide"
+                f"{'' if self.adaptive_stats['converged'] else ' (did not converge to the configured tolerance)'}\n"
+            )
         return summary
 
     def generate_table(self):
@@ -298,11 +1445,8 @@ class ForecastGenerator:
         percentiles = sorted(range(10, 100, 10))
 
         for probability in percentiles:
-            # Correctly calculate the upper bound using the current percentile
-            upper_bound_days = np.percentile(self.weeks_to_complete, probability) * 5
-
-            # Calculate the date by adding the upper bound days to the current date
-            to_date = datetime.today() + timedelta(days=upper_bound_days)
+            # Date at the current percentile
+            to_date = self.forecast.date_at(probability)
 
             # Append the data for each probability level
             table_data.append({
@@ -314,14 +1458,68 @@ class ForecastGenerator:
         forecast_table = pd.DataFrame(table_data)
         return forecast_table
 
+    @staticmethod
+    def generate_how_many_table(tickets_completed, final_ticket_count):
+        """Builds the table of how many tickets will be completed by the end date at each probability, and the chance of reaching the final ticket count."""
+        table_data = []
+        for probability in range(10, 100, 10):
+            # The number of tickets there is at least a `probability`% chance of completing
+            tickets = np.percentile(tickets_completed, 100 - probability, method='inverted_cdf')
+            table_data.append({
+                'Probability | ': f"{probability}% | ",
+                'At least ': f"{int(tickets)} tickets "
+            })
+
+        probability_of_final_count = np.mean(tickets_completed >= final_ticket_count) * 100
+        return pd.DataFrame(table_data), probability_of_final_count
+
+    @staticmethod
+    def generate_sensitivity_table(grid_forecasts, confidence_levels):
+        """Builds one row per (rolling average weeks, scope buffer) cell with its forecast date at each confidence level."""
+        table_data = []
+
+        for (weeks, buffer), forecast in sorted(grid_forecasts.items()):
+            row = {'Rolling Weeks': weeks, 'Scope Buffer': f"{buffer:.0%}"}
+            for confidence in confidence_levels:
+                row[f"{confidence:g}%"] = forecast.date_at(confidence).strftime('%d %b %Y')
+            table_data.append(row)
+
+        return pd.DataFrame(table_data)
+
+    @staticmethod
+    def generate_portfolio_table(targets, forecasts, confidence):
+        """Builds one row per portfolio target with its forecast date at 50%, the configured confidence and 95%."""
+        percentiles = sorted({50, int(confidence), 95})
+        table_data = []
+
+        for target, forecast in zip(targets, forecasts):
+            row = {
+                'Project': target['project'],
+                'Release': target['release'],
+                'Remaining': target['remainingTicketCount']
+            }
+            for probability in percentiles:
+                row[f"{probability}%"] = forecast.date_at(probability).strftime('%d %b %Y')
+            table_data.append(row)
+
+        return pd.DataFrame(table_data)
+
 # Step 5: Plotting
 from datetime import datetime
 
 class PlotManager:
     @staticmethod
-    def plot_cycle_time_distribution(data, path, xlabel, ylabel, title, num_bins, completed_count, graph_type, config):
+    def plot_cycle_time_distribution(data, path, xlabel, ylabel, title, num_bins, completed_count, graph_type, config, weights=None):
         plt.figure(figsize=(10, 6))
-        historical_count = len(data)
+
+        if isinstance(data, ForecastResult):
+            data = data.simulation
+        if isinstance(data, SimulationResult):
+            # Plot from the histogram counts rather than from individual trials, skipping negligible probabilities
+            weeks = np.flatnonzero(data.counts > data.total * 1e-6)
+            data, weights = weeks, data.counts[weeks]
+
+        historical_count = len(data) if weights is None else np.sum(weights)
 
         if historical_count == 0:
             print("No data to plot.")
@@ -333,13 +1531,18 @@ class PlotManager:
         bins = 'auto' if bins < 2 else bins  # Use 'auto' if there are fewer than 2 unique values
 
         # Plot histogram
-        n, bins, patches = plt.hist(data, bins=bins, alpha=0.75, color='skyblue', edgecolor='black')
+        n, bins, patches = plt.hist(data, bins=bins, weights=weights, alpha=0.75, color='skyblue', edgecolor='black')
 
         # Annotate histogram
         PlotManager._annotate_histogram(n, bins, historical_count)
 
         # Plot mean, median, and standard deviation lines
-        mean, median, std_dev = np.mean(data), np.median(data), np.std(data)
+        if weights is None:
+            mean, median, std_dev = np.mean(data), np.median(data), np.std(data)
+        else:
+            mean = np.average(data, weights=weights)
+            median = PlotManager._weighted_percentile(data, weights, 50)
+            std_dev = np.sqrt(np.average((data - mean) ** 2, weights=weights))
         PlotManager._plot_vertical_lines(mean, median, std_dev)
 
         # Get the confidence level and calculate the corresponding percentile
@@ -350,7 +1553,11 @@ class PlotManager:
         else:
             confidence_percentile = float(confidence_level)
         
-        percentile_value = np.percentile(data, confidence_percentile)  # Calculate the percentile value
+        # Calculate the percentile value
+        if weights is None:
+            percentile_value = np.percentile(data, confidence_percentile)
+        else:
+            percentile_value = PlotManager._weighted_percentile(data, weights, confidence_percentile)
 
         # Plot vertical line for the percentile
         plt.axvline(percentile_value, color='red', linestyle='dashed', linewidth=1.5, label=f'{confidence_level} Percentile: {percentile_value:.2f}')
@@ -367,6 +1574,13 @@ class PlotManager:
         plt.savefig(path, bbox_inches='tight')
         plt.clf()
 
+    @staticmethod
+    def _weighted_percentile(data, weights, percentile):
+        """Returns the smallest value whose cumulative weight reaches the given percentile."""
+        order = np.argsort(data)
+        cdf = np.cumsum(np.asarray(weights)[order]) / np.sum(weights)
+        return np.asarray(data)[order][SimulationResult.percentile_index(cdf, percentile)]
+
     @staticmethod
     def _annotate_histogram(n, bins, historical_count):
         for count, center in zip(n, bins[:-1]):
@@ -385,9 +1599,8 @@ class PlotManager:
 
     @staticmethod
     def plot_throughput_by_week(weekly_counts, output_path, config, week_start=True):
-        # Convert 'Done Year Week' to datetime objects
-        # First, interpret each "Year-Week" as the start of the week (Monday)
-        weekly_counts['Date'] = pd.to_datetime(weekly_counts['Done Year Week'] + '-1', format='%Y-%W-%w')
+        # Each week starts on Monday
+        weekly_counts['Date'] = pd.to_datetime(weekly_counts['Week Start'])
 
         # Adjust to the correct week start (Sunday) or end (Saturday)
         if week_start:
@@ -506,6 +1719,7 @@ def main():
 
     # Load configuration
     config = ConfigManager('ignore/configs.json')
+    Dataset.keep_text_columns = config.get('debugOutput', 'no') == 'yes'
 
     # Optionally update data from Jira
     if input('Update data from Jira (Y): ').lower() == 'y':
@@ -526,18 +1740,37 @@ def main():
 
     # Load and process data to calculate cycle times from change log csv
     file_path = config.get('csvFolderPath') + config.get('csvFileName')
-    change_log="yes"
-    df = DataManager.read_csv(file_path, config.get('release'), config.get('excluded_from_status'), config.get('excluded_issue_types'),
-                              config.get('wip_categories_included'), config.get('epic_to_exclude'),change_log)
-
-    cycle_time_history = DataManager.calculate_cycle_times(df,config)
-    
-    # load and process data to calculate weekly throughput csv file without change logs
     file_path_regular = config.get('csvFolderPath')+config.get('csv_list_of_tickets')
-    change_log="no"
-    df_regular = DataManager.read_csv(file_path_regular, config.get('release'), "", config.get('excluded_issue_types'),
-                              config.get('wip_categories_included'), config.get('epic_to_exclude'),change_log)
-    weekly_throughput, throughput, completed_tickets_count = DataManager.calculate_avg_weekly_throughput(df_regular, config.get('rollingAvgWeeks'))
+    if config.get('streamExports', 'no') == 'yes':
+        # Aggregate the exports chunk by chunk so memory stays bounded however large they are
+        chunk_size = config.get('streamChunkSize', 100000)
+        chunks = DataManager.read_csv_chunks(file_path, config.get('release'), config.get('excluded_from_status'), config.get('excluded_issue_types'),
+                                             config.get('wip_categories_included'), "yes", chunk_size)
+        cycle_time_history = DataManager.calculate_cycle_times_streaming(chunks, config)
+
+        chunks_regular = DataManager.read_csv_chunks(file_path_regular, config.get('release'), "", config.get('excluded_issue_types'),
+                                                     config.get('wip_categories_included'), "no", chunk_size)
+        weekly_throughput, throughput, completed_tickets_count = DataManager.calculate_avg_weekly_throughput_streaming(chunks_regular, config.get('rollingAvgWeeks'))
+    elif config.get('aggregateStore', 'no') == 'yes':
+        # Query the persisted aggregates, rebuilding them from the exports first if they have changed since the last run
+        store_path = config.get('aggregateStorePath', os.path.join(config.get('csvFolderPath'), 'aggregates'))
+        cycle_time_history = DataManager.calculate_cycle_times_from_store(AggregateStore(store_path, file_path), config.get('release'), config.get('excluded_from_status'),
+                                                                          config.get('excluded_issue_types'), config.get('wip_categories_included'))
+        weekly_throughput, throughput, completed_tickets_count = DataManager.calculate_avg_weekly_throughput_from_store(
+            AggregateStore(store_path, file_path_regular), config.get('release'), config.get('excluded_issue_types'),
+            config.get('wip_categories_included'), config.get('rollingAvgWeeks'))
+    else:
+        change_log="yes"
+        df = DataManager.read_csv(file_path, config.get('release'), config.get('excluded_from_status'), config.get('excluded_issue_types'),
+                                  config.get('wip_categories_included'), config.get('epic_to_exclude'),change_log)
+
+        cycle_time_history = DataManager.calculate_cycle_times(df,config)
+
+        # load and process data to calculate weekly throughput csv file without change logs
+        change_log="no"
+        df_regular = DataManager.read_csv(file_path_regular, config.get('release'), "", config.get('excluded_issue_types'),
+                                  config.get('wip_categories_included'), config.get('epic_to_exclude'),change_log)
+        weekly_throughput, throughput, completed_tickets_count = DataManager.calculate_avg_weekly_throughput(df_regular, config.get('rollingAvgWeeks'))
 
     # Plot throughput by week
     PlotManager.plot_throughput_by_week(
@@ -554,16 +1787,22 @@ def main():
     )
 
     # Run Monte Carlo simulation
-    if completed_tickets_count >= 10 and config.get('remainingTicketCount') != 0:
-        weeks_to_complete = MonteCarloSimulator.run_simulation(
-            weekly_throughput, 
-            config.get('remainingTicketCount'), 
-            takt_time,  # Pass the Takt Time to the simulation
-            config.get('rollingAvgWeeks'),
-            config
-        )
-        PlotManager.plot_cycle_time_distribution(weeks_to_complete, config.get('imagesPath') + 'weeksToComplete.png',
-                                                 'Weeks', '# of Simulations', 'Monte Carlo Analysis', config.get('number_of_bins'), completed_tickets_count, "mc", config)
+    if completed_tickets_count >= 10 and DataManager.has_recent_throughput(weekly_throughput, config.get('rollingAvgWeeks')) and config.get('remainingTicketCount') != 0:
+        # Run the configured engine, or load its result from the cache when the inputs haven't changed
+        weeks_to_complete, adaptive_stats = MonteCarloSimulator.run_configured_engine(config, weekly_throughput, cycle_time_history, takt_time)
+
+        plot_title, plot_ylabel = {
+            'exact': ('Exact Forecast Distribution', 'Probability'),
+            'cycle_time': ('Monte Carlo Analysis (Cycle Time)', '# of Simulations')
+        }.get(config.get('simulationEngine', 'monte_carlo'), ('Monte Carlo Analysis', '# of Simulations'))
+
+        # Anchor the distribution to today on the working-day calendar; the summary, tables and plot all read from it
+        forecast = ForecastResult(weeks_to_complete, holidays=config.get('holidays', []))
+        forecast.save(os.path.join(config.get('csvFolderPath'), 'forecast_result.json'))
+
+        # Plot the distribution of weeks directly from the histogram counts
+        PlotManager.plot_cycle_time_distribution(forecast, config.get('imagesPath') + 'weeksToComplete.png',
+                                                 'Weeks', plot_ylabel, plot_title, config.get('number_of_bins'), completed_tickets_count, "mc", config)
 
        # Generate and print forecast summary
         forecast_generator = ForecastGenerator(
@@ -577,8 +1816,10 @@ def main():
             rolling_avg_completion_rate=throughput,
             confidence=config.get('confidenceLevels'),
             remaining_tickets=config.get('remainingTicketCount'),
-            weeks_to_complete=weeks_to_complete,
-            rolling_avg_weeks=config.get('rollingAvgWeeks')
+            forecast=forecast,
+            rolling_avg_weeks=config.get('rollingAvgWeeks'),
+            adaptive_stats=adaptive_stats,
+            scope_buffer=config.get('scopeBuffer', 0.10)
         )
 
         print(forecast_generator.generate_summary())
@@ -602,9 +1843,140 @@ def main():
 
             print(f"To complete the remaining {remaining_tickets} tickets by {end_date}, the team needs to complete {tickets_per_week_needed:.2f} tickets per week.")
             print(f"Required Takt Time: {required_takt_time:.2f} hours per ticket ")
+            print(f"There's a {forecast.probability_by(end_date):.1f}% chance of completing the remaining {remaining_tickets} (+{config.get('scopeBuffer', 0.10):.0%} buffer) tickets by {end_date}.")
+
+            # Simulate how many tickets will be completed by the end date
+            tickets_completed = MonteCarloSimulator.run_how_many(
+                weekly_throughput,
+                end_date,
+                config.get('rollingAvgWeeks'),
+                seed=config.get('simulationSeed')
+            )
+            how_many_table, probability_of_final_count = ForecastGenerator.generate_how_many_table(tickets_completed, config.get('finalTicketCount'))
+            print(f"\nTickets completed by {end_date}:")
+            print(how_many_table.to_string(index=False))
+            print(f"There's a {probability_of_final_count:.1f}% chance of completing the final ticket count of {config.get('finalTicketCount')} tickets by {end_date}.\n")
 
     else:
         print('Not enough completed tickets for simulation or all tickets are done.')
 
+# Portfolio Execution: forecast every release listed in the 'portfolio' config in one run
+def portfolio_main():
+    config = ConfigManager('ignore/configs.json')
+    Dataset.keep_text_columns = config.get('debugOutput', 'no') == 'yes'
+    targets = config.get('portfolio', [])
+    if not targets:
+        print('Add the releases to forecast to the "portfolio" list in the config file.')
+        return
+
+    # Load the list of tickets once for every target
+    dataset = Dataset.load(config.get('csvFolderPath') + config.get('csv_list_of_tickets'), Dataset.TICKET_COLUMNS)
+
+    issue_types = config.get('excluded_issue_types')
+    excluded_epics = config.get('epic_to_exclude')
+    rolling_avg_weeks = config.get('rollingAvgWeeks')
+    forecast_targets = []
+    forecasts = []
+
+    # Each project is one team: its throughput is sampled once and shared by all of its releases
+    projects = list(dict.fromkeys(target['project'] for target in targets))
+    for project in projects:
+        team_mask = dataset.df['Jira Key'].str.startswith(f"{project}-")
+        throughput_df = dataset.view(team_mask & dataset.wip_category_mask(config.get('wip_categories_included')) & dataset.issue_type_mask(issue_types))
+        weekly_throughput, _, completed_tickets_count = DataManager.calculate_avg_weekly_throughput(throughput_df, rolling_avg_weeks)
+        if completed_tickets_count < 10 or not DataManager.has_recent_throughput(weekly_throughput, rolling_avg_weeks):
+            print(f'Not enough completed tickets for simulation in project {project}.')
+            continue
+
+        team_targets = []
+        for target in targets:
+            if target['project'] != project:
+                continue
+            remaining_tickets = target.get('remainingTicketCount')
+            if remaining_tickets is None:
+                release_df = dataset.view(team_mask & dataset.release_mask(target['release']))
+                remaining_tickets = len(DataManager.filter_remaining_tickets(release_df, issue_types, excluded_epics))
+            team_targets.append({'project': project, 'release': target['release'], 'remainingTicketCount': remaining_tickets})
+
+        forecast_targets.extend(team_targets)
+        results = MonteCarloSimulator.run_portfolio_simulation(
+            weekly_throughput,
+            [target['remainingTicketCount'] for target in team_targets],
+            rolling_avg_weeks,
+            n_simulations=config.get('numberOfSimulations', 10000),
+            seed=config.get('simulationSeed')
+        )
+        forecasts.extend(ForecastResult(result, holidays=config.get('holidays', [])) for result in results)
+
+    portfolio_table = ForecastGenerator.generate_portfolio_table(forecast_targets, forecasts, float(str(config.get('confidenceLevels')).strip('%')))
+    portfolio_table.to_csv(os.path.join(config.get('csvFolderPath'), 'portfolio_forecast.csv'), index=False)
+    print("\nPortfolio Forecast:")
+    print(portfolio_table.to_string(index=False), "\n")
+
+# Sensitivity Execution: forecast a grid of rollingAvgWeeks, scopeBuffer and confidenceLevels in one run
+def sweep_main():
+    config = ConfigManager('ignore/configs.json')
+    Dataset.keep_text_columns = config.get('debugOutput', 'no') == 'yes'
+    grid = config.get('sensitivityGrid', {})
+    rolling_avg_weeks_list = grid.get('rollingAvgWeeks', [config.get('rollingAvgWeeks')])
+    scope_buffers = grid.get('scopeBuffer', [config.get('scopeBuffer', 0.10)])
+    confidence_levels = grid.get('confidenceLevels', [config.get('confidenceLevels')])
+
+    # Count the remaining tickets and load the weekly throughput the same way as the forecast
+    DataManager.sum_of_tickets(
+        csv_file_name=config.get('csvFolderPath') + config.get('csv_list_of_tickets'),
+        releases=config.get('release'),
+        issue_types=config.get('excluded_issue_types'),
+        excluded_epics=config.get('epic_to_exclude'),
+        config_manager=config
+    )
+    file_path_regular = config.get('csvFolderPath')+config.get('csv_list_of_tickets')
+    df_regular = DataManager.read_csv(file_path_regular, config.get('release'), "", config.get('excluded_issue_types'),
+                              config.get('wip_categories_included'), config.get('epic_to_exclude'), "no")
+    weekly_throughput, _, completed_tickets_count = DataManager.calculate_avg_weekly_throughput(df_regular, config.get('rollingAvgWeeks'))
+
+    if (completed_tickets_count < 10 or config.get('remainingTicketCount') == 0
+            or not all(DataManager.has_recent_throughput(weekly_throughput, weeks) for weeks in rolling_avg_weeks_list)):
+        print('Not enough completed tickets for simulation or all tickets are done.')
+        return
+
+    grid_results = MonteCarloSimulator.run_sensitivity_grid(
+        weekly_throughput,
+        config.get('remainingTicketCount'),
+        rolling_avg_weeks_list,
+        scope_buffers,
+        n_simulations=config.get('numberOfSimulations', 10000),
+        seed=config.get('simulationSeed')
+    )
+
+    grid_forecasts = {cell: ForecastResult(result, holidays=config.get('holidays', [])) for cell, result in grid_results.items()}
+    sensitivity_table = ForecastGenerator.generate_sensitivity_table(grid_forecasts, [float(str(level).strip('%')) for level in confidence_levels])
+    sensitivity_table.to_csv(os.path.join(config.get('csvFolderPath'), 'sensitivity_forecast.csv'), index=False)
+    print("\nSensitivity of the forecast date (on or before):")
+    print(sensitivity_table.to_string(index=False), "\n")
+
+# Remove every cached simulation result
+def invalidate_cache_main():
+    config = ConfigManager('ignore/configs.json')
+    cache = SimulationCache(config.get('cachePath', os.path.join(config.get('csvFolderPath'), 'cache')), config.get('cacheMaxMB', 100))
+    removed = cache.invalidate()
+    print(f'Removed {removed} cached simulation results from {cache.cache_path}.')
+
+    # The aggregate stores are rebuilt from the full exports on the next run
+    store_path = config.get('aggregateStorePath', os.path.join(config.get('csvFolderPath'), 'aggregates'))
+    if os.path.isdir(store_path):
+        stores = [name for name in os.listdir(store_path) if name.startswith('aggregates_') and name.endswith('.json')]
+        for name in stores:
+            os.remove(os.path.join(store_path, name))
+        print(f'Removed {len(stores)} aggregate stores from {store_path}.')
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'forecast'
+    if mode == 'portfolio':
+        portfolio_main()
+    elif mode == 'sweep':
+        sweep_main()
+    elif mode == 'invalidate-cache':
+        invalidate_cache_main()
+    else:
+        main()
\ No newline at end of file
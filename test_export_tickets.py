@@ -0,0 +1,194 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+import requests
+
+import export_tickets
+from export_tickets import JiraClient
+
+
+class FakeResponse:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+def test_retry_after_reads_seconds_and_falls_back_on_malformed_dates():
+    assert JiraClient.retryAfter(FakeResponse({"Retry-After": "7"}), 0) == 7.0
+    assert JiraClient.retryAfter(FakeResponse({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}), 0) == 0.0
+    ## a malformed date backs off exponentially (with jitter) instead of raising
+    for attempt in range(3):
+        assert 2 ** attempt / 2 <= JiraClient.retryAfter(FakeResponse({"Retry-After": "soon-ish"}), attempt) <= 2 ** attempt
+
+
+def test_throttled_rate_recovers_with_elapsed_time_not_with_successes(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(export_tickets.time, "monotonic", lambda: clock[0])
+    client = JiraClient(None, {}, requestsPerSecond=10)
+    client.throttled()
+    client.throttled()
+    assert client.rate == 2.5
+
+    ## calls taking no time don't bring the rate back
+    client.tokens = 5
+    for _ in range(5):
+        client.acquire()
+    assert client.rate == 2.5
+
+    ## half of RECOVERY_SECONDS later it has regained half of maxRate
+    clock[0] += JiraClient.RECOVERY_SECONDS / 2
+    client.acquire()
+    assert client.rate == 7.5
+    clock[0] += JiraClient.RECOVERY_SECONDS
+    client.acquire()
+    assert client.rate == 10
+
+
+def searchPage():
+    ## three tickets: one without history, one in progress and one done, with their change logs newest first
+    def ticket(key, status, histories, resolved=None):
+        return {"key": key, "changelog": {"histories": histories, "total": len(histories)},
+                "fields": {"summary": key, "status": {"name": status}, "issuetype": {"name": "Story"},
+                           "created": "2024-03-01T09:00:00.000-0500", "resolutiondate": resolved, "labels": [],
+                           "fixVersions": [{"name": "R1"}], "components": [], "parent": {"fields": {"summary": "Epic"}}}}
+
+    def history(changeID, created, fromStatus, toStatus):
+        return {"id": str(changeID), "created": created, "items": [{"field": "status", "fromString": fromStatus, "toString": toStatus}]}
+
+    return {"issues": [
+        ticket("P-1", "Backlog", []),
+        ticket("P-2", "Peer Review", [history(12, "2024-03-06T10:00:00.000-0500", "In Progress", "Peer Review"),
+                                      history(11, "2024-03-04T09:00:00.000-0500", "To Do", "In Progress")]),
+        ticket("P-3", "Done", [history(22, "2024-03-08T16:00:00.000-0500", "In Progress", "Done"),
+                               history(21, "2024-03-05T09:00:00.000-0500", "To Do", "In Progress")],
+               resolved="2024-03-08T16:00:00.000-0500"),
+    ]}
+
+
+def test_normalized_export_joins_back_into_the_denormalized_rows(tmp_path):
+    from monte_carlo import Dataset
+
+    client = JiraClient(None, {})
+    export_tickets.export_change_logs(searchPage(), str(tmp_path / "denormalized.csv"), "w", client, "", "", "")
+    statusCodes = {}
+    export_tickets.export_change_logs(searchPage(), str(tmp_path / "normalized.csv"), "w", client, "", "", "", "normalized", statusCodes)
+
+    denormalized = Dataset._read(str(tmp_path / "denormalized.csv"))
+    normalized = Dataset._read(str(tmp_path / "normalized.csv"))
+    assert denormalized["Age in the last WIP Status"].gt(0).sum() == 2    ## P-1's only row and P-2's last transition
+    pd.testing.assert_frame_equal(normalized[denormalized.columns].astype(str), denormalized.astype(str))
+
+    ## chunks smaller than a ticket's transitions still join each ticket's transitions together
+    chunked = pd.concat(Dataset.read_chunks(str(tmp_path / "normalized.csv"), None, 1), ignore_index=True)
+    pd.testing.assert_frame_equal(chunked[denormalized.columns].astype(str), denormalized.astype(str))
+
+
+def test_status_lookup_is_written_before_the_transitions(tmp_path, monkeypatch):
+    ## an export interrupted after a page's tables were written still has a lookup covering their codes
+    written = []
+    realWrite = export_tickets.write_status_codes
+    monkeypatch.setattr(export_tickets, "write_status_codes", lambda destination, codes: (written.append(dict(codes)), realWrite(destination, codes)))
+    export_tickets.export_change_logs(searchPage(), str(tmp_path / "jira.csv"), "w", JiraClient(None, {}), "", "", "", "normalized", {})
+
+    statuses = pd.read_csv(tmp_path / "jira_statuses.csv")
+    transitions = pd.read_csv(tmp_path / "jira_transitions.csv")
+    assert len(written) == 1
+    assert set(transitions["From status code"].dropna()) | set(transitions["To status code"].dropna()) <= set(statuses["Status Code"])
+
+
+class PagedKeys:
+    ## answers key-only searches from a list of keys, a page at a time
+    def __init__(self, keys):
+        self.keys = keys
+        self.urls = []
+
+    def get(self, url):
+        self.urls.append(url)
+        startAt = int(url.rsplit("startAt=", 1)[1])
+        return {"total": len(self.keys), "issues": [{"key": key} for key in self.keys[startAt:startAt+2]]}
+
+
+def test_reconciliation_removes_the_tickets_missing_from_the_project(tmp_path):
+    store = export_tickets.openTicketStore(str(tmp_path / "store.sqlite"))
+    export_tickets.upsertTickets(store, searchPage(), JiraClient(None, {}), "", "", "")
+    client = PagedKeys(["P-1", "P-3", "P-4"])    ## P-2 was deleted or moved out of the project; P-4 is new and not synced yet
+
+    assert export_tickets.removeMissingTickets(store, export_tickets.fetchProjectKeys(client, "https://jira/search?jql=project+%3D+P", 1, pageSize=2)) == 1
+    assert all("&fields=key&" in url for url in client.urls) and len(client.urls) == 2
+    assert [issue["key"] for page in export_tickets.storedPages(store) for issue in page["issues"]] == ["P-1", "P-3"]
+    assert store.execute("SELECT COUNT(*) FROM histories WHERE jira_key = 'P-2'").fetchone()[0] == 0
+    assert store.execute("SELECT COUNT(*) FROM histories").fetchone()[0] == 2
+
+
+def test_combined_search_query_asks_for_the_union_of_both_exports_fields():
+    query = export_tickets.combinedSearchQuery("&fields=key,summary, created,description&sorter/order=ASC&maxResults=1000&startAt=",
+                                               "&fields=key,summary, status,resolutiondate&type=story&expand=changelog&startAt=")
+    assert query == "&fields=key,summary,created,description,status,resolutiondate&expand=changelog&maxResults=100&startAt="
+    assert export_tickets.combinedSearchQuery("&maxResults=1000&startAt=", "") == "&fields=&expand=changelog&maxResults=100&startAt="
+
+
+class StubJira(BaseHTTPRequestHandler):
+    ## answers each path with its scripted responses in turn (the last one repeats), after a little latency
+    script = {}
+    calls = {}
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        with self.server.lock:
+            count = self.calls[self.path] = self.calls.get(self.path, 0) + 1
+        status, headers, body = self.script[self.path][min(count, len(self.script[self.path])) - 1]
+        time.sleep(0.02)
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in dict(headers, **{"Content-Type": "application/json", "Content-Length": str(len(payload))}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+@pytest.fixture
+def stubJira():
+    StubJira.calls = {}
+    StubJira.script = {
+        "/throttled": [(429, {"Retry-After": "0"}, {}), (503, {"Retry-After": "0"}, {}), (200, {}, {"page": "throttled"})],
+        "/flaky": [(502, {}, {}), (200, {}, {"page": "flaky"})],
+        "/missing": [(404, {}, {"errorMessages": ["Issue does not exist"]})],
+        "/down": [(503, {"Retry-After": "0"}, {})],
+    }
+    StubJira.script.update({f"/page/{page}": [(200, {}, {"page": page})] for page in range(12)})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubJira)
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_client_retries_throttled_and_failed_requests(stubJira, monkeypatch):
+    monkeypatch.setattr(JiraClient, "retryAfter", staticmethod(lambda response, attempt: 0.0 if response is not None and response.headers.get("Retry-After") else 0.01))
+    client = JiraClient(None, {}, maxRetries=3, requestsPerSecond=50)
+
+    assert client.get(stubJira + "/throttled") == {"page": "throttled"}
+    assert StubJira.calls["/throttled"] == 3
+    assert client.rate < client.maxRate / 1.5     ## halved by the 429 and only partly recovered since
+    assert client.get(stubJira + "/flaky") == {"page": "flaky"}
+    assert StubJira.calls["/flaky"] == 2
+
+    ## other errors are not retried, and retries give up after maxRetries
+    with pytest.raises(requests.HTTPError):
+        client.get(stubJira + "/missing")
+    assert StubJira.calls["/missing"] == 1
+    with pytest.raises(requests.HTTPError):
+        client.get(stubJira + "/down")
+    assert StubJira.calls["/down"] == 4
+
+
+def test_pages_fetched_concurrently_come_back_in_order(stubJira):
+    client = JiraClient(None, {}, workers=4, requestsPerSecond=100)
+    urls = [f"{stubJira}/page/{page}" for page in range(12)]
+    assert [data["page"] for data in export_tickets.fetchPagesInOrder(urls, client, 4)] == list(range(12))
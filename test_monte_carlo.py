@@ -0,0 +1,264 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from monte_carlo import AggregateStore, ConfigManager, DataManager, Dataset, ForecastResult, MonteCarloSimulator, PlotManager, SimulationResult
+
+
+@pytest.fixture(autouse=True)
+def fresh_datasets():
+    # Dataset caches every export it loads by path; the tests rewrite exports in place
+    Dataset._loaded.clear()
+    yield
+    Dataset._loaded.clear()
+    Dataset.keep_text_columns = False
+
+
+def write_change_log(path, transitions):
+    """transitions: (key, release, wip category, from status, days, change id) tuples."""
+    pd.DataFrame([{
+        'Jira Key': key, 'IssueType': 'Story', 'WIP Category': wip_category, 'Release': str(release),
+        'From status': from_status, 'Time in From Status (days)': days, 'Jira Change ID': change_id
+    } for key, release, wip_category, from_status, days, change_id in transitions]).to_csv(path, index=False)
+
+
+def write_ticket_list(path, tickets):
+    """tickets: (key, release, wip category, date completed or None) tuples."""
+    rows = []
+    for key, release, wip_category, completed in tickets:
+        done = pd.Timestamp(completed).isocalendar() if completed else (0, 0, 0)
+        rows.append({'Jira Key': key, 'IssueType': 'Story', 'WIP Category': wip_category, 'Release': str(release), 'Epic Link': '',
+                     'Date Completed': completed, 'Done Year': done[0], 'Done Week': done[1]})
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+
+CHANGE_LOG_BEFORE = [
+    ('P-1', ['R1'], 'WIP', 'To Do', 1.0, 1), ('P-1', ['R1'], 'WIP', 'In Progress', 2.5, 2),
+    ('P-2', ['R2'], 'WIP', 'In Progress', 4.0, 3),
+    ('P-3', ['R1'], 'WIP', 'In Progress', 3.0, 4),
+    ('P-4', ['R1'], 'WIP', 'In Progress', 5.0, 6),
+    ('P-5', ['R1'], 'Prioritized', 'To Do', None, 0),
+]
+CHANGE_LOG_AFTER = [
+    ('P-1', ['R1'], 'WIP', 'To Do', 1.0, 1), ('P-1', ['R1'], 'WIP', 'In Progress', 2.5, 2), ('P-1', ['R1'], 'WIP', 'Peer Review', 0.5, 10),
+    ('P-2', ['R1', 'R2'], 'WIP', 'In Progress', 4.0, 3),    # fix version added after work began
+    ('P-3', ['R1'], 'Cancelled', 'In Progress', 3.0, 4),     # cancelled
+    ('P-5', ['R1'], 'WIP', 'To Do', 0.25, 11),               # started; P-4 was moved out of the project
+    ('P-6', ['R1'], 'WIP', 'Backlog', 2.0, 12), ('P-6', ['R1'], 'WIP', 'In Progress', 1.5, 13),
+    ('P-9', ['R1'], 'WIP', 'In Progress', 6.0, 5),            # moved in from another project with its older change IDs
+]
+FILTERS = dict(releases='R1', exclude_from_status=['Backlog'], issue_types=['Epic'], wip_category_included=['Done', 'WIP'])
+
+
+def test_aggregate_store_rebuilt_from_a_changed_export_matches_a_full_computation(tmp_path):
+    export = str(tmp_path / 'jira.csv')
+    write_change_log(export, CHANGE_LOG_BEFORE)
+    store = AggregateStore(str(tmp_path / 'aggregates'), export)
+    DataManager.calculate_cycle_times_from_store(store, **FILTERS)
+
+    write_change_log(export, CHANGE_LOG_AFTER)
+    Dataset._loaded.clear()
+    stored = DataManager.calculate_cycle_times_from_store(store, **FILTERS)
+
+    Dataset._loaded.clear()
+    df = DataManager.read_csv(export, FILTERS['releases'], FILTERS['exclude_from_status'], FILTERS['issue_types'],
+                              FILTERS['wip_category_included'], [], 'yes')
+    full = DataManager.calculate_cycle_times(df, {'csvFolderPath': str(tmp_path)})
+    np.testing.assert_allclose(stored, full)
+    assert full.size == 5
+
+    # Reloaded from disk, and queried with different filters without a rebuild
+    reloaded = AggregateStore(str(tmp_path / 'aggregates'), export)
+    assert reloaded.is_current()
+    np.testing.assert_allclose(reloaded.cycle_times(None, [], ['WIP', 'Cancelled'], []), [4.0, 4.0, 3.0, 0.25, 3.5, 6.0])
+
+
+def test_aggregate_store_drops_reopened_and_adds_late_matching_completions(tmp_path):
+    export = str(tmp_path / 'jira_ticket_list.csv')
+    write_ticket_list(export, [('P-1', ['R1'], 'Done', '2024-03-05'), ('P-2', ['R2'], 'Done', '2024-03-12'), ('P-3', ['R1'], 'Done', '2024-03-19')])
+    store = AggregateStore(str(tmp_path / 'aggregates'), export)
+    DataManager.calculate_avg_weekly_throughput_from_store(store, 'R1', [], ['Done', 'WIP'], 8)
+
+    write_ticket_list(export, [('P-1', ['R1'], 'WIP', None), ('P-2', ['R1', 'R2'], 'Done', '2024-03-12'), ('P-3', ['R1'], 'Done', '2024-03-19')])
+    Dataset._loaded.clear()
+    assert not store.is_current()  # the export changed, so the next query rebuilds the store
+    DataManager.calculate_avg_weekly_throughput_from_store(store, 'R1', [], ['Done', 'WIP'], 8)
+
+    Dataset._loaded.clear()
+    df = DataManager.read_csv(export, 'R1', '', [], ['Done', 'WIP'], [], 'no')
+    np.testing.assert_array_equal(np.sort(store.completed_weeks('R1', [], ['Done', 'WIP'])), np.sort(DataManager.completed_weeks(df)))
+
+
+def test_cycle_time_engine_counts_calendar_weeks(tmp_path):
+    # Four tickets of 7 calendar days each through 2 WIP slots finish after 14 calendar days: 2 weeks
+    result = MonteCarloSimulator.run_cycle_time_simulation([7.0], 4, 2, {'csvFolderPath': str(tmp_path)}, n_simulations=50, seed=1)
+    assert result.min() == 2 and result.percentile(100) == 2
+
+
+def test_week_ordinals_follow_iso_weeks():
+    dates = pd.date_range('2019-12-23', '2025-01-12', freq='D')
+    weeks = DataManager.week_ordinals(dates)
+    iso = dates.isocalendar()
+    # A new ordinal starts every Monday, exactly when the ISO (year, week) changes
+    iso_changes = (iso['week'].to_numpy()[1:] != iso['week'].to_numpy()[:-1])
+    np.testing.assert_array_equal(np.diff(weeks) == 1, iso_changes)
+    assert set(np.diff(weeks)) <= {0, 1}
+    np.testing.assert_array_equal(DataManager.week_start_dates(weeks), dates.to_period('W-SUN').start_time.to_numpy(dtype='datetime64[D]'))
+
+
+def test_weekly_throughput_fills_idle_weeks_up_to_the_end_week():
+    monday = DataManager.week_ordinals([pd.Timestamp('2024-03-04')])[0]
+    weekly = DataManager.weekly_throughput([monday, monday, monday + 2], end_week=monday + 4)
+    np.testing.assert_array_equal(weekly['Week'], monday + np.arange(5))
+    np.testing.assert_array_equal(weekly['Jira Key'], [2, 0, 1, 0, 0])
+    assert weekly['Week Start'].iloc[0] == pd.Timestamp('2024-03-04')
+
+
+def test_adaptive_interval_narrows_with_trials_and_uses_the_workers(tmp_path):
+    weekly = pd.DataFrame({'Jira Key': [3, 5, 2, 6, 4, 1, 7, 4]})
+    config = {'csvFolderPath': str(tmp_path)}
+    result, stats = MonteCarloSimulator.run_adaptive_simulation(weekly, 60, 8, config, 85, tolerance_days=1, chunk_size=1000,
+                                                                max_simulations=200000, seed=3)
+    assert stats['converged'] and stats['trials'] > 1000 and 0 < stats['interval_width_days'] <= 1
+    assert result.total == stats['trials']
+
+    sharded, sharded_stats = MonteCarloSimulator.run_adaptive_simulation(weekly, 60, 8, config, 85, tolerance_days=1, chunk_size=1000,
+                                                                         max_simulations=200000, seed=3, workers=2)
+    np.testing.assert_array_equal(sharded.counts, result.counts)
+    assert sharded_stats == stats
+
+
+def test_exact_distribution_agrees_with_the_monte_carlo_engine(tmp_path):
+    weekly = pd.DataFrame({'Jira Key': [3, 5, 0, 6, 4, 1, 7, 4]})
+    config = {'csvFolderPath': str(tmp_path)}
+    exact = MonteCarloSimulator.exact_distribution(weekly, 60, 8, config)
+    sampled = MonteCarloSimulator.run_simulation(weekly, 60, None, 8, config, n_simulations=200000, seed=5)
+
+    assert exact.total == pytest.approx(1.0)
+    _, exact_cdf = exact.ecdf()
+    _, sampled_cdf = sampled.ecdf()
+    size = max(exact_cdf.size, sampled_cdf.size)
+    pad = lambda cdf: np.pad(cdf, (0, size - cdf.size), constant_values=1.0)
+    np.testing.assert_allclose(pad(sampled_cdf), pad(exact_cdf), atol=0.005)
+    assert exact.mean() == pytest.approx(sampled.mean(), abs=0.02)
+
+
+def test_sharded_simulation_is_deterministic_across_worker_counts(tmp_path, monkeypatch):
+    monkeypatch.setattr(MonteCarloSimulator, 'SHARD_SIZE', 3000)
+    weekly = pd.DataFrame({'Jira Key': [3, 5, 2, 6, 4, 1, 7, 4]})
+    config = {'csvFolderPath': str(tmp_path)}
+    # 10000 trials make four shards, the last one partial
+    serial = MonteCarloSimulator.run_simulation(weekly, 60, None, 8, config, n_simulations=10000, seed=11, workers=1)
+    for workers in (2, 3):
+        sharded = MonteCarloSimulator.run_simulation(weekly, 60, None, 8, config, n_simulations=10000, seed=11, workers=workers)
+        np.testing.assert_array_equal(sharded.counts, serial.counts)
+    assert serial.total == 10000
+
+    other_seed = MonteCarloSimulator.run_simulation(weekly, 60, None, 8, config, n_simulations=10000, seed=12, workers=1)
+    assert not np.array_equal(other_seed.counts, serial.counts)
+
+
+def test_simulation_result_round_trips_through_npz(tmp_path):
+    result = SimulationResult.from_weeks([4, 2, 4, 7, 4, 2])
+    result.save(str(tmp_path / 'result.npz'))
+    loaded = SimulationResult.load(str(tmp_path / 'result.npz'))
+    np.testing.assert_array_equal(loaded.counts, [0, 0, 2, 0, 3, 0, 0, 1])
+    assert loaded.counts.dtype == result.counts.dtype
+    assert (loaded.total, loaded.min(), loaded.percentile(50), loaded.percentile(100)) == (6, 2.0, 4.0, 7.0)
+    assert loaded.mean() == pytest.approx(23 / 6)
+
+    # Probabilities from the exact engine keep their float counts
+    exact = SimulationResult(np.array([0.0, 0.25, 0.75]))
+    exact.save(str(tmp_path / 'exact.npz'))
+    np.testing.assert_array_equal(SimulationResult.load(str(tmp_path / 'exact.npz')).counts, exact.counts)
+
+
+def test_adaptive_engine_results_are_cached(tmp_path):
+    weekly = pd.DataFrame({'Jira Key': [3, 5, 2, 6, 4, 1, 7, 4]})
+    config = {'csvFolderPath': str(tmp_path), 'simulationEngine': 'adaptive', 'simulationSeed': 3, 'simulationCache': 'yes',
+              'remainingTicketCount': 60, 'rollingAvgWeeks': 8, 'confidenceLevels': '85%', 'adaptiveToleranceDays': 1}
+    result, stats = MonteCarloSimulator.run_configured_engine(config, weekly, [], None)
+    assert type(stats['interval_width_days']) is float and type(stats['converged']) is bool
+
+    cached, cached_stats = MonteCarloSimulator.run_configured_engine(config, weekly, [], None)
+    np.testing.assert_array_equal(cached.counts, result.counts)
+    assert cached_stats == stats
+
+
+def test_a_stale_throughput_window_has_nothing_to_simulate():
+    monday = DataManager.week_ordinals([pd.Timestamp('2025-01-06')])[0]
+    completions = list(np.repeat(monday + np.arange(10), 4))    # 40 tickets over ten weeks, then nothing
+    weekly = DataManager.weekly_throughput(completions, end_week=monday + 20)
+    assert DataManager.has_recent_throughput(weekly, 12)
+    assert not DataManager.has_recent_throughput(weekly, 8)
+
+
+def test_sweep_cell_for_the_configured_settings_matches_the_forecast(tmp_path):
+    weekly = pd.DataFrame({'Jira Key': [3, 5, 2, 6, 4, 1, 7, 4]})
+    config = {'csvFolderPath': str(tmp_path), 'simulationCache': 'no', 'simulationEngine': 'exact',
+              'remainingTicketCount': 55, 'scopeBuffer': 0.10, 'rollingAvgWeeks': 8}
+    forecast, _ = MonteCarloSimulator.run_configured_engine(config, weekly, [], None)
+    grid = MonteCarloSimulator.run_sensitivity_grid(weekly, 55, [8], [0.10], n_simulations=50000, seed=2)
+    for percentile in (50, 85, 95):
+        assert abs(grid[(8, 0.10)].percentile(percentile) - forecast.percentile(percentile)) <= 1
+    # without the buffer the forecast is for 55 tickets, not 61
+    unbuffered, _ = MonteCarloSimulator.run_configured_engine(dict(config, scopeBuffer=0), weekly, [], None)
+    assert unbuffered.mean() < forecast.mean() - 1
+
+
+def test_debug_dump_of_the_remaining_tickets_keeps_every_column(tmp_path):
+    export = str(tmp_path / 'jira_ticket_list.csv')
+    pd.DataFrame([
+        {'Jira Key': 'P-1', 'Summary': 'one', 'IssueType': 'Story', 'Current Status': 'In Progress', 'Ticket Created On': '2024-03-01',
+         'WIP Category': 'WIP', 'Release': "['R1']", 'Epic Link': '', 'Date Completed': None, 'Done Year': 0, 'Done Week': 0, 'Done Year Week': '0'},
+        {'Jira Key': 'P-2', 'Summary': 'two', 'IssueType': 'Story', 'Current Status': 'Done', 'Ticket Created On': '2024-03-01',
+         'WIP Category': 'Done', 'Release': "['R1']", 'Epic Link': '', 'Date Completed': '2024-03-08', 'Done Year': 2024, 'Done Week': 10, 'Done Year Week': '2024-10'},
+    ]).to_csv(export, index=False)
+    (tmp_path / 'configs.json').write_text(json.dumps({'configData': [{'csvFolderPath': str(tmp_path), 'scopeBuffer': 0.10}]}))
+    config = ConfigManager(str(tmp_path / 'configs.json'))
+
+    Dataset.keep_text_columns = True
+    DataManager.sum_of_tickets(export, 'R1', [], [], config)
+    dump = pd.read_csv(tmp_path / 'debug_sum_jira_tickets.csv', index_col=0)
+    assert list(dump.columns) == ['Jira Key', 'Summary', 'IssueType', 'Current Status', 'Ticket Created On', 'WIP Category', 'Release',
+                                  'Epic Link', 'Date Completed', 'Done Year', 'Done Week', 'Done Year Week']
+    assert list(dump['Jira Key']) == ['P-1'] and config.get('remainingTicketCount') == 1 and config.get('finalTicketCount') == 2
+
+
+def test_cache_hits_write_the_debug_output_and_ignore_inputs_the_engine_does_not_use(tmp_path):
+    weekly = pd.DataFrame({'Jira Key': [3, 5, 2, 6, 4, 1, 7, 4]})
+    config = {'csvFolderPath': str(tmp_path), 'simulationEngine': 'exact', 'simulationCache': 'yes', 'debugOutput': 'yes',
+              'remainingTicketCount': 60, 'rollingAvgWeeks': 8, 'numberOfSimulations': 1000, 'simulationSeed': 1}
+    result, _ = MonteCarloSimulator.run_configured_engine(config, weekly, [], None)
+    debug_file = tmp_path / 'debug_step3_exact_distribution.npz'
+    debug_file.unlink()
+
+    # A different seed and number of simulations still hit the cache, and the hit writes the debug file again
+    cached, _ = MonteCarloSimulator.run_configured_engine(dict(config, numberOfSimulations=5000, simulationSeed=2), weekly, [], None)
+    assert len(list((tmp_path / 'cache').glob('*.npz'))) == 1
+    np.testing.assert_array_equal(SimulationResult.load(str(debug_file)).counts, result.counts)
+    np.testing.assert_array_equal(cached.counts, result.counts)
+
+
+def test_exact_distribution_keeps_the_tail_beyond_max_weeks(tmp_path, capsys):
+    weekly = pd.DataFrame({'Jira Key': [3, 5, 0, 6, 4, 1, 7, 4]})
+    config = {'csvFolderPath': str(tmp_path)}
+    full = MonteCarloSimulator.exact_distribution(weekly, 60, 8, config)
+    cut = MonteCarloSimulator.exact_distribution(weekly, 60, 8, config, max_weeks=14)
+
+    assert 'stopped at 14 weeks' in capsys.readouterr().out
+    assert cut.counts.size == 16 and cut.total == pytest.approx(1.0)
+    np.testing.assert_allclose(cut.counts[:15], full.counts[:15])
+    assert cut.counts[15] == pytest.approx(full.counts[15:].sum())
+    assert cut.percentile(95) == 15
+
+
+def test_forecast_and_plot_percentiles_match_the_simulation():
+    result = SimulationResult.from_weeks([4, 2, 4, 7, 4, 2, 9, 5])
+    forecast = ForecastResult(result, anchor_date='2024-03-04')
+    weeks = np.flatnonzero(result.counts)
+    for percentile in (25, 50, 85, 100):
+        assert forecast.weeks_at(percentile) == result.percentile(percentile)
+        assert PlotManager._weighted_percentile(weeks, result.counts[weeks], percentile) == result.percentile(percentile)